@@ -0,0 +1,341 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of TetrisGame, run as
+
+    python3 -m unittest discover tests
+"""
+from __future__ import annotations
+
+import io
+import os
+import random
+import tempfile
+import unittest
+from typing import List, Tuple
+
+from tetris import (Shape, Tetrominoes, TetrisBoard, TetrisBitBoard, TetrisGame,
+                    TetrisSparseBoard, placements)
+from tetris.ai import best_placement
+from tetris.archive import ReplayArchive, pack
+from tetris.board import TILE_KEYS, _mix, row_key
+from tetris.game import GAMES, MOVES, apply_move
+from tetris.placement import rows_key
+from tetris.randomizer import make_randomizer
+from tetris.replay import EVENTS, ReplayPlayer, ReplayReader, ReplayRecorder
+from tetris.simulate import run_games
+
+def rescan(game: TetrisGame) -> list:
+    """Height of each column found from the tiles, regardless of game.heights"""
+    return [game.column_height(col, game.nTilesV) for col in range(game.nTilesH)]
+
+def drop_pieces(game: TetrisGame, seed: int, pieces: int) -> None:
+    """Drop the pieces of a started game, mostly at the best placement and sometimes at a random
+    orientation and column, such that rows are cleared and holes are left"""
+    rng = random.Random(seed)
+    while game.started and game.pieces < pieces:
+        target = best_placement(game, game.this_piece)
+        if target is None or rng.random() < 0.3:
+            piece = Shape.table[game.this_piece.shape][rng.randrange(4)]
+            game.try_pos(piece, rng.randrange(game.nTilesH), game.cur_y)
+        else:
+            game.try_pos(target.piece, target.x, game.cur_y)
+        game.hard_drop()
+        game.make_new_piece()
+
+class TickRecorder(ReplayRecorder):
+    """Recorder that also keeps the tick of each event written, to compare with the replay"""
+    def __init__(self, stream):
+        super().__init__(stream)
+        self.ticks = []
+
+    def write(self, code: int, payload: bytes = b"") -> None:
+        self.ticks.append(self.tick)
+        super().write(code, payload)
+
+def record_game(seed: int, pieces: int = 40) -> Tuple[TetrisGame, bytes, List[int]]:
+    """Play a game with a recorder attached, with idle gaps of up to thousands of ticks between
+    the events, moves to the best placement, which are try_pos() to another position, and random
+    moves otherwise
+
+    Returns:
+        The game at the end, its replay, and the tick of each event
+    """
+    stream = io.BytesIO()
+    game = TetrisGame(randomizer=make_randomizer("uniform", seed))
+    recorder = TickRecorder(stream)
+    recorder.attach(game)
+    rng = random.Random(seed)
+    game.start()
+    while game.started and game.pieces < pieces:
+        recorder.tick += rng.choice((0, 1, 2, 14, 15, 16, 100, 5000))
+        if game.neednewpiece:
+            game.make_new_piece()
+        elif rng.random() < 0.2:
+            target = best_placement(game, game.this_piece)
+            if target is not None:
+                game.try_pos(target.piece, target.x, game.cur_y)
+        else:
+            apply_move(game, rng.choice(MOVES))
+    return game, stream.getvalue(), recorder.ticks
+
+def same_game(game: TetrisGame) -> tuple:
+    """What should be the same in two games in the same state, to compare"""
+    return (game.pieces, game.rows_completed, game.zobrist, list(game.bitmasks()),
+            game.this_piece, game.cur_x, game.cur_y, game.started)
+
+class UndoTest(unittest.TestCase):
+    def test_undo_clear_under_overhang(self):
+        """A row cleared above the stack of a column, i.e., over an overhang, is put back"""
+        game = TetrisGame(4, 8, undo=10)
+        game.start()
+        for x in range(3):
+            game[x, 2] = Tetrominoes.LShape # column 0 is empty below it
+        for y in range(2):
+            for x in range(1, 4):
+                game[x, y] = Tetrominoes.JShape
+        self.assertTrue(game.try_pos(Shape.table[Tetrominoes.IShape][0], 3, 2))
+        game.piece_dropped()
+        self.assertEqual(game.rows_completed, 1)
+        self.assertTrue(game.undo())
+        self.assertEqual(game.heights, rescan(game))
+        self.assertEqual(game.heights[0], 3)
+        # a piece dropped in column 0 lands on the row put back, not through it
+        self.assertTrue(game.try_pos(Shape.table[Tetrominoes.IShape][0], 0, 7))
+        self.assertEqual(game.drop_row(), 3)
+
+    def test_undo_everything(self):
+        """Undo all pieces of random games, the height map is consistent after every undo and the
+        board is empty at the end"""
+        for backend, cls in GAMES.items():
+            for seed in range(30):
+                game = cls(6, 12, randomizer=make_randomizer("uniform", seed), undo=None)
+                game.start()
+                empty = game.zobrist
+                drop_pieces(game, seed, 200)
+                while game.undo():
+                    self.assertEqual(game.heights, rescan(game), "%s seed %d" % (backend, seed))
+                self.assertEqual(game.zobrist, empty, "%s seed %d" % (backend, seed))
+
+    def test_undo_after_restore(self):
+        """The pieces dropped after a snapshot are not undone after restoring it, but those
+        dropped before are"""
+        for backend, cls in GAMES.items():
+            game = cls(10, 18, randomizer=make_randomizer("uniform", 0), undo=10)
+            game.start()
+            empty = game.zobrist
+            drop_pieces(game, 0, 2)
+            state, tiles = game.snapshot(), list(game.bitmasks())
+            drop_pieces(game, 0, 4)
+            game.restore(state)
+            self.assertEqual(len(game.undo_stack), 1, backend)
+            self.assertEqual(game.bitmasks(), tiles, backend)
+            self.assertTrue(game.undo())
+            self.assertFalse(game.undo())
+            self.assertEqual(game.heights, rescan(game), backend)
+            self.assertEqual(game.zobrist, empty, backend)
+
+def full_hash(board: TetrisBoard) -> int:
+    """Zobrist hash of a board computed from all its tiles, regardless of board.zobrist"""
+    zobrist = 0
+    for y in range(board.nTilesV):
+        rowhash = 0
+        for x in range(board.nTilesH):
+            rowhash ^= TILE_KEYS[x*8 + board[x, y]]
+        zobrist ^= _mix(rowhash, y)
+    return zobrist
+
+class ZobristTest(unittest.TestCase):
+    def test_incremental_hash(self):
+        """The hash kept by each board backend is the same as computed from all tiles, after
+        fixing pieces, removing and putting back full rows, and restoring a snapshot"""
+        for cls in (TetrisBoard, TetrisBitBoard, TetrisSparseBoard):
+            for seed in range(5):
+                board = cls(6, 12)
+                rng = random.Random(seed)
+                state = board.snapshot() if hasattr(board, "snapshot") else None
+                for _ in range(200):
+                    piece = Shape.table[rng.randint(1, 7)][rng.randrange(4)]
+                    min_x, max_x, _, max_y = piece.extent
+                    x = rng.randint(-min_x, board.nTilesH - 1 - max_x)
+                    y = board.landing_row(piece, x)
+                    if y + max_y >= board.nTilesV:
+                        board.clear()
+                        continue
+                    board.fix_pos(piece, x, y)
+                    self.assertEqual(board.zobrist, full_hash(board), cls.__name__)
+                    if state is not None: # the backend can put back full rows
+                        removed = tuple((row,) + board.row_state(row)
+                                        for row in sorted(board.fullrows))
+                    board.removefull()
+                    self.assertEqual(board.zobrist, full_hash(board), cls.__name__)
+                    if state is None:
+                        continue
+                    if removed and rng.random() < 0.5:
+                        board.insertrows(removed)
+                        self.assertEqual(board.zobrist, full_hash(board), cls.__name__)
+                        board.removefull()
+                    if rng.random() < 0.1:
+                        state = board.snapshot()
+                    elif rng.random() < 0.05:
+                        board.restore(state)
+                        self.assertEqual(board.zobrist, full_hash(board), cls.__name__)
+
+    def test_placement_key(self):
+        """The key of each placement is the same as of the rows of the board with the piece fixed
+        there and the full rows removed, and row_key() hashes a row as the boards do"""
+        for seed in range(20):
+            game = TetrisGame(6, 12, randomizer=make_randomizer("uniform", seed))
+            game.start()
+            drop_pieces(game, seed, 20)
+            if not game.started:
+                continue
+            for placement in placements(game, game.this_piece):
+                board = TetrisBitBoard(game.nTilesH, game.nTilesV)
+                board.restore(game.snapshot().board)
+                board.fix_pos(placement.piece, placement.x, placement.y)
+                board.removefull()
+                self.assertEqual(placement.key, rows_key(board.bitmasks()), "seed %d" % seed)
+                self.assertEqual(placement.rows, board.bitmasks()[:len(placement.rows)])
+        for y in range(12):
+            for mask in (1, 0b101101, (1 << 64) - 1):
+                self.assertEqual(row_key(mask, y), _mix(mask, y))
+        self.assertNotEqual(row_key(1 << 64, 0), row_key(1, 0)) # wider rows mix in every bit
+
+class SparseGameTest(unittest.TestCase):
+    def test_same_as_bit_board(self):
+        """A game on the sparse board plays the same as on the bit board"""
+        for seed in range(10):
+            games = [cls(8, 16, randomizer=make_randomizer("uniform", seed))
+                     for cls in GAMES.values()]
+            for game in games:
+                game.start()
+                drop_pieces(game, seed, 300)
+            bit, sparse = games
+            self.assertEqual((bit.pieces, bit.rows_completed, bit.zobrist, bit.heights),
+                             (sparse.pieces, sparse.rows_completed, sparse.zobrist,
+                              sparse.heights))
+            self.assertEqual(bit.bitmasks(), sparse.bitmasks())
+
+class DirtyRowsTest(unittest.TestCase):
+    def test_copy_from_dirty_rows(self):
+        """A copy of the board that takes only the rows from take_dirty() stays the same as the
+        board, through rows cleared, undo and restore"""
+        for backend, cls in GAMES.items():
+            for seed in range(10):
+                game = cls(6, 12, randomizer=make_randomizer("uniform", seed), undo=None)
+                game.start()
+                game.take_dirty()
+                copied = [bytes(game.nTilesH)] * game.nTilesV
+                state = game.snapshot()
+                rng = random.Random(seed)
+                for step in range(300):
+                    if rng.random() < 0.2:
+                        game.undo()
+                    elif rng.random() < 0.02:
+                        game.restore(state)
+                    else:
+                        drop_pieces(game, step, game.pieces + 1)
+                    if not game.started:
+                        game.start()
+                    for y in game.take_dirty():
+                        copied[y] = bytes(game.row_state(y)[1])
+                    board = [bytes(game.row_state(y)[1]) for y in range(game.nTilesV)]
+                    self.assertEqual(copied, board, "%s seed %d" % (backend, seed))
+
+class ReplayTest(unittest.TestCase):
+    def test_replay_same_game(self):
+        """Playing back a replay ends in the same game as recorded, including the events after
+        long idle gaps, which have their tick delta in a varint"""
+        codes = set()
+        for seed in range(10):
+            game, replay, recorded = record_game(seed)
+            ticks = [event.tick for event in ReplayReader(replay)]
+            self.assertEqual(ticks, recorded)
+            deltas = [b - a for a, b in zip(ticks, ticks[1:])]
+            self.assertTrue(any(delta < 15 for delta in deltas))
+            self.assertTrue(any(delta == 15 for delta in deltas))
+            self.assertTrue(any(delta > 15 + 127 for delta in deltas)) # varint of two bytes
+            replayed = ReplayPlayer(replay).run()
+            self.assertEqual(same_game(replayed), same_game(game), "seed %d" % seed)
+            codes.update(event.code for event in ReplayReader(replay))
+        self.assertEqual(codes, set(range(len(EVENTS))))
+
+    def test_seek_back(self):
+        """Seeking back, through the snapshots or to before any of them, reaches the same game
+        as a new player seeking forward to the same tick"""
+        _, replay, _ = record_game(0)
+        player = ReplayPlayer(io.BytesIO(replay), snapshot_every=1000)
+        player.run()
+        last = player.tick
+        self.assertGreater(len(player.snapshots), 3)
+        for tick in [last, last - 1, last // 2, last // 3 + 7, 999, 1000, 1, 0, last // 2]:
+            game = player.seek(tick)
+            fresh = ReplayPlayer(replay).seek(tick)
+            self.assertEqual(same_game(game), same_game(fresh), "tick %d" % tick)
+
+class ArchiveTest(unittest.TestCase):
+    def test_pack_and_read(self):
+        """Replay files packed into an archive are found by their key and read back from the
+        mapped file byte for byte, and play back to the same game"""
+        with tempfile.TemporaryDirectory() as tmp:
+            games, names = {}, []
+            for seed in (3, 1, 2):
+                game, replay, _ = record_game(seed, pieces=10)
+                games[seed] = (game, replay)
+                names.append(os.path.join(tmp, "%d.ttr" % seed))
+                with open(names[-1], "wb") as stream:
+                    stream.write(replay)
+            path = os.path.join(tmp, "games.ttra")
+            self.assertEqual(pack(path, names), 3)
+            with ReplayArchive(path) as archive:
+                self.assertEqual(len(archive), 3)
+                with self.assertRaises(KeyError):
+                    archive.find(4)
+                with self.assertRaises(IndexError):
+                    archive.entry(3)
+                offset = 0
+                for i, seed in enumerate((3, 1, 2)):
+                    game, replay = games[seed]
+                    self.assertEqual(archive.find(seed), i)
+                    entry = archive.entry(i)
+                    self.assertEqual(entry.key, seed)
+                    self.assertEqual(entry.length, len(replay))
+                    self.assertGreaterEqual(entry.offset, offset)
+                    offset = entry.offset + entry.length
+                    view = archive[i]
+                    self.assertEqual(bytes(view), replay)
+                    view.release()
+                    player = archive.player(i)
+                    self.assertEqual(same_game(player.run()), same_game(game))
+                    del player # release the view into the archive
+                self.assertEqual(offset, os.path.getsize(path))
+
+class SimulateTest(unittest.TestCase):
+    def test_same_for_any_workers(self):
+        """The games simulated in a process pool are the same as in this process"""
+        seeds = list(range(8))
+        for policy in ("random", "ai"):
+            results = [[stats[:4] for stats in run_games(seeds, policy, max_pieces=50,
+                                                         workers=workers)]
+                       for workers in (1, 3)]
+            self.assertEqual(results[0], results[1], policy)
+            self.assertEqual([stats[0] for stats in results[0]], seeds)
+
+class ForkTest(unittest.TestCase):
+    def test_fork_of_recorded_game(self):
+        """A fork plays on itself, not on the recorded game, and is not written to its replay"""
+        stream = io.BytesIO()
+        game = TetrisGame(randomizer=make_randomizer("uniform", 0))
+        ReplayRecorder(stream).attach(game)
+        game.start()
+        recorded, cur_y = stream.tell(), game.cur_y
+        child = game.fork()
+        self.assertTrue(child.one_row_down())
+        self.assertEqual(child.cur_y, cur_y - 1)
+        self.assertEqual(game.cur_y, cur_y)
+        self.assertEqual(stream.tell(), recorded)
+
+if __name__ == "__main__":
+    unittest.main()
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
@@ -5,300 +5,19 @@ Tetris implementation in Tkinter with one wide panel contain both the game and t
 """
 from __future__ import annotations
 
-from enum import IntEnum, unique
-from typing import Tuple, List, Callable
-import random
+from typing import Tuple
 import logging
+import os
 import tkinter
 
+from tetris import Tetrominoes, TetrisGame, GameLoop
+from tetris.loop import FRAMES_PER_SECOND
+
+# log level from environment, e.g. TETRIS_LOGLEVEL=DEBUG, default to warnings only
 logging.basicConfig(
-    level=logging.DEBUG,
+    level=os.environ.get("TETRIS_LOGLEVEL", "WARNING").upper(),
     format="%(asctime)-15s|%(levelname)s|%(filename)s:%(lineno)d:%(name)s|%(message)s")
 
-#
-# Helper classes that are independent of the GUI library
-#
-
-@unique
-class Tetrominoes(IntEnum):
-    """Name of one-sided tetrominoes, https://en.wikipedia.org/wiki/Tetromino"""
-    NoShape = 0
-    IShape = 1
-    JShape = 2
-    LShape = 3
-    OShape = 4
-    SShape = 5
-    TShape = 6
-    ZShape = 7
-
-class Shape:
-    """7 tetrominoes shapes + dummy. We make x axis the bottom edge each shape, hence min y for
-    shape coordinates should be 0
-    """
-    shapeCoords = (
-        (( 0, 0), (0, 0), (0, 0), (0, 0)),  # 0 = NoShape
-        (( 0, 3), (0, 2), (0, 1), (0, 0)),  # 1 = I
-        ((-1, 0), (0, 0), (0, 1), (0, 2)),  # 2 = J
-        (( 1, 0), (0, 0), (0, 1), (0, 2)),  # 3 = L
-        (( 0, 1), (1, 1), (0, 0), (1, 0)),  # 4 = O
-        ((-1, 0), (0, 0), (0, 1), (1, 1)),  # 5 = S
-        ((-1, 0), (0, 0), (1, 0), (0, 1)),  # 6 = T
-        ((-1, 1), (0, 1), (0, 0), (1, 0)),  # 7 = Z
-    )
-
-    def __init__(self, shape: Tetrominoes = Tetrominoes.NoShape):
-        """Construct a new shape. The variable self.coords is pre-created and later on modified
-        in-place. It should not be a reference to Shape.shapeCoords as it will be modified when
-        the shape is moved.
-        """
-        self.coords = [list(x) for x in Shape.shapeCoords[shape]]
-        self._shape = shape
-
-    @property
-    def shape(self) -> Tetrominoes:
-        """return shape of this piece"""
-        return self._shape
-
-    @shape.setter
-    def shape(self, shape: Tetrominoes) -> None:
-        """Reset this piece to another shape, with self.coords updated
-        """
-        self.coords[:] = [list(x) for x in self.shapeCoords[shape]]
-        self._shape = shape
-
-    @staticmethod
-    def randomize() -> Shape:
-        """Give a random piece"""
-        shape = Tetrominoes(random.randint(1, len(Shape.shapeCoords)-1))
-        return Shape(shape)
-
-    @property
-    def x(self) -> List[int]:
-        "All x-coordinate of a shape's tiles"
-        return [coord[0] for coord in self.coords]
-
-    @property
-    def y(self) -> List[int]:
-        "All y-coordinate of a shape's tiles"
-        return [coord[1] for coord in self.coords]
-
-    def min_y(self) -> int:
-        "Tell the min y-coordinate of this shape"
-        return min(coords[1] for coords in self.coords)
-
-    def _transform(self, transform: Callable) -> Shape:
-        """Transform this shape with a callable function, used by self.rotateLeft() and
-        self.rotateRight() only"""
-        result = Shape(self.shape) # same piece
-        result.coords = [transform(x, y) for x, y in self.coords]
-        return result
-
-    def rotate_cw(self) -> Shape:
-        "Produce a piece of this shape rotate about origin for 90 deg cw"
-        if self.shape == Tetrominoes.OShape:
-            return self # no rotate for "O"
-        cw = lambda x, y: [y, -x]
-        return self._transform(cw)
-
-    def rotate_ccw(self) -> Shape:
-        "Produce a piece of this shape rotate about origin for 90 deg ccw"
-        if self.shape == Tetrominoes.OShape:
-            return self # no rotate for "O"
-        ccw = lambda x, y: [-y, x]
-        return self._transform(ccw)
-
-class TetrisBoard:
-    """A python class overriding __setitem__ and __getitem__ to hold the state of a Tetris board
-    The coordinate system has x going positive toward right and y going positive upward
-    """
-    def __init__(self, width: int = 10, height: int = 18):
-        """Set the tiles dimension in the game board. Gameboy Tetris is 10x18"""
-        self.nTilesH = width  # i.e., row size in num of square tiles
-        self.nTilesV = height # i.e., col size in num of square tiles
-        # row major array to hold tiles, from the tile we can look up the shape
-        self.tiles : List[Tetrominoes] = []
-        self.clear()
-
-    def __setitem__(self, key: Tuple[int, int], value: Tetrominoes) -> None:
-        """Setter to allow board[x,y] = shape syntax"""
-        col, row = key # board[x,y] -> key will be a tuple
-        self.tiles[row*self.nTilesH + col] = value
-
-    def __getitem__(self, key: Tuple[int, int]) -> Tetrominoes:
-        """Setter to allow board[x,y] syntax"""
-        col, row = key # board[x,y] -> key will be a tuple
-        return self.tiles[row*self.nTilesH + col]
-
-    def clear(self) -> None:
-        """Fill the board with "no shape" pieces"""
-        self.tiles[:] = [Tetrominoes.NoShape] * (self.nTilesV * self.nTilesH)
-
-    def check_pos(self, piece: Shape, x: int, y: int) -> bool:
-        """Check the validity of placing the a piece at position (x,y)
-
-        Returns:
-            boolean for whether it is valid to place the piece at (x,y)
-        """
-        logging.debug("check_pos %s shape on (%d, %d)", piece.shape, x, y)
-        coords = [[px+x, py+y] for px, py in piece.coords if py+y < self.nTilesV]
-        if not coords:
-            logging.debug("fail for fully above the board: %s -> %s", piece.coords, coords)
-            return False
-        if not all(0 <= cx < self.nTilesH and cy >= 0 for cx, cy in coords):
-            logging.debug("fail for crossing board boundary: %s -> %s", piece.coords, coords)
-            return False
-        if any(self[cx, cy] != Tetrominoes.NoShape for cx, cy in coords):
-            logging.debug("fail for collision")
-            return False
-        return True # all other cases is OK
-
-    def fix_pos(self, piece: Shape, x: int, y: int) -> None:
-        """Fix a piece at position (x, y), assumed corresponding check_pos() returns
-        True. The board is updated after this function called.
-        """
-        coords = [[px+x, py+y] for px, py in piece.coords]
-        for cx, cy in coords:
-            self[cx, cy] = piece.shape
-
-    def removefull(self) -> int:
-        """Remove any full rows in the board. Move rows down and refill the top rows with
-        NoShape. This board will be updated after this function call if any full rows are removed
-
-        Returns:
-            The number of rows removed
-        """
-        # Check each rows for what is not full
-        notfull = [y for y in range(self.nTilesV)
-                   if any(self[x, y] == Tetrominoes.NoShape for x in range(self.nTilesH))]
-        logging.debug("not full rows: %s", notfull)
-        if self.nTilesV == len(notfull):
-            return 0
-        # Remove anything that is full
-        move = [(i, j) for i, j in enumerate(notfull) if i != j]
-        for j, k in move:
-            logging.debug("Moving row %d to row %d", k, j)
-            for i in range(self.nTilesH):
-                self[i, j] = self[i, k]
-        # Fill in any new rows at top with NoShape
-        toprow = max(i for i, _ in move) + 1
-        for j in range(toprow, self.nTilesV):
-            logging.debug("filling empty row: %d", j)
-            for i in range(self.nTilesH):
-                self[i, j] = Tetrominoes.NoShape
-        return self.nTilesV - len(notfull)
-
-class TetrisGame(TetrisBoard):
-    """Tetris game with logic. Implement all interface-independent logic here"""
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        # This and next piece of tetrominoes, and the position of the current piece
-        self.this_piece = Shape()
-        self.next_piece = Shape()
-        self.cur_x = 0
-        self.cur_y = 0
-        # State variable of the game
-        self.neednewpiece = False   # Old piece dropped, new piece to be created
-        self.paused = False         # Game paused, timer should be suspended
-        self.started = False        # Game started, timer should be created
-        self.rows_completed = 0     # Game state: number of rows completed
-        self.score = 0              # Track score
-        self.level = 0              # Track level
-
-    def start(self) -> bool:
-        """Trigger start of the game. Initialize everything.
-
-        Returns:
-            Boolean to indicate the game started successfully. It failed to start only if the game
-            has been paused.
-        """
-        if self.paused:
-            return False
-        self.started = True
-        self.neednewpiece = False
-        self.rows_completed = 0
-        self.score = 0
-        self.level = 1
-        self.next_piece = Shape.randomize()
-        self.make_new_piece()
-        self.clear()
-        return True
-
-    def make_new_piece(self) -> bool:
-        """Generate a new piece of tetromino. If we cannot place it in the default position, the
-        game is finished.
-
-        Returns:
-            Boolean to indicate we can still generate a new piece and place it on the board
-        """
-        # generate new piece and position at top middle, then check if we can still proceed
-        self.neednewpiece = False
-        if self.try_pos(self.next_piece, self.nTilesH // 2, self.nTilesV - 1):
-            self.next_piece = Shape.randomize() # next_piece became this_piece, replace it with a new one
-            return True
-        # cannot even place the shape at top middle of the board, finish the game
-        self.this_piece.shape = Tetrominoes.NoShape
-        self.started = False
-        return False
-
-    def pause(self) -> bool:
-        """Toggle pause state
-
-        Returns:
-            Whether the game is paused. If the game is not started, always True
-        """
-        if not self.started:
-            return True
-        self.paused = not self.paused
-        return self.paused
-
-    def try_pos(self, piece: Shape, x: int, y: int) -> bool:
-        """Attempt to place a piece onto the game board such that its origin is at position (x, y).
-        The piece is not registered on the board but will check against the board for collision. If
-        the position is valid, such positions are remembered as self.cur_x and self.cur_y and the
-        piece is replacing self.this_piece
-
-        Returns:
-            Boolean to indicate whether this piece and position is valid
-        """
-        if self.check_pos(piece, x, y):
-            # this position is good, remember it
-            self.this_piece = piece
-            self.cur_x = x
-            self.cur_y = y
-            return True
-        return False # the piece cannot be placed at this position
-
-    def piece_dropped(self) -> None:
-        """Call this only if try_pos() failed on the lowest position self.cur_y-1. This merge in
-        self.this_piece into the board, remove all existing full rows, and move down all the rows
-        above them. It also hint for generating a new piece in the next step.  This is the only
-        place the flag self.neednewpiece is asserted.
-        """
-        # fix this_piece into the board (ignore any tile above top boundary)
-        xs = [self.cur_x + x for x in self.this_piece.x]
-        ys = [self.cur_y + y for y in self.this_piece.y if self.cur_y + y < self.nTilesV]
-        for x, y in zip(xs, ys):
-            self[x, y] = self.this_piece.shape
-        self.neednewpiece = True
-        self.this_piece.shape = Tetrominoes.NoShape
-        # find all rows that are full and remove them
-        rows_removed = self.removefull()
-        logging.debug("%d rows removed", rows_removed)
-        if rows_removed:
-            self.rows_completed += rows_removed
-
-    def one_row_down(self) -> bool:
-        """Move self.this_piece one row down, i.e., to self.cur_y-1. If we cannot move down, call
-        self.piece_dropped() to update the game state
-
-        Returns:
-            Boolean to indicate if we can successfully move the current piece to one row down
-        """
-        if self.try_pos(self.this_piece, self.cur_x, self.cur_y - 1):
-            return True
-        self.piece_dropped()
-        return False
-
 #
 # GUI classes
 #
@@ -306,7 +25,7 @@ class TetrisGame(TetrisBoard):
 class Tetris(tkinter.Frame):
     """The tetris game implemented in tkinter. Dummy class with logic reside in the board class
     """
-    speed = 300
+    interval = 1000 // FRAMES_PER_SECOND # timer interval in ms, one display frame
 
     def __init__(self, parent):
         super().__init__(parent)
@@ -318,6 +37,11 @@ class Tetris(tkinter.Frame):
         n_hori, n_vert = 10, 18
         self.timer = None
         self.board = TetrisGame(n_hori, n_vert)
+        self.loop = GameLoop(self.board)
+        self.geometry = None        # (left margin, top margin, tile width, tile height) of the grid
+        self.cells = []             # canvas items of the tile on each cell, same order as board
+        self.shown = bytearray()    # shape shown on each cell, same order as board
+        self.hint = None            # (next piece, tile width, tile height) shown on hint canvas
         # bind events on panel
         self.parent.bind("<Key>", self.OnKeyDown)
         self.Refresh()
@@ -357,14 +81,15 @@ class Tetris(tkinter.Frame):
         return self.gamecanvas.winfo_height() // self.board.nTilesV
 
     def start(self) -> None:
-        """Trigger start of the game. The important thing here is to start the timer for a regular
-        interval of self.speed after initializing all state variables
+        """Trigger start of the game. The important thing here is to start the timer firing on every
+        display frame after initializing all state variables
         """
         if self.board.start():
             self.message.config(text="")
+            self.loop.reset()
             if self.timer:
                 self.parent.after_cancel(self.timer) # in case after already set up
-            self.timer = self.parent.after(self.speed, self.OnTimer) # timer fire regularly in pulses
+            self.timer = self.parent.after(self.interval, self.OnTimer) # timer fire on every frame
             logging.debug("game started: %s", self.board.started)
 
     def pause(self) -> None:
@@ -376,9 +101,10 @@ class Tetris(tkinter.Frame):
             self.message.config(text="Paused")
             self.config(bg="#E1E1E1")
         else:
+            self.loop.reset() # time paused does not count
             if self.timer:
                 self.parent.after_cancel(self.timer) # in case after already set up
-            self.timer = self.parent.after(self.speed, self.OnTimer)
+            self.timer = self.parent.after(self.interval, self.OnTimer)
             self.message.config(text="")
             self.config(bg="#FFFFFF")
         self.Refresh()
@@ -391,15 +117,15 @@ class Tetris(tkinter.Frame):
             Whether we have successfully moved the piece to one row down
         """
         moved = self.board.one_row_down()
-        self.Refresh()
+        self.loop.invalidate()
         return moved
 
     def drop_down(self) -> None:
-        """Move the piece down one row at a time until we are at the bottom row or we cannot move
-        further down, then trigger the on_dropped() function to check for completed rows
+        """Move the piece straight down to where it lands, found from the height map of the board,
+        then trigger the on_dropped() function to check for completed rows
         """
-        while self.move_down():
-            pass
+        self.board.hard_drop()
+        self.loop.invalidate() # one repaint for the whole drop
         logging.debug("drop piece to curr_y = %d", self.board.cur_y)
 
     def try_move(self, piece, x_delta) -> None:
@@ -408,111 +134,152 @@ class Tetris(tkinter.Frame):
         """
         if self.board.try_pos(piece, self.board.cur_x + x_delta, self.board.cur_y):
             logging.debug("Moved %s to (%s,%s)", piece.shape, self.board.cur_x, self.board.cur_y)
-            self.Refresh()
+            self.loop.invalidate()
         else:
             logging.debug("Cannot move %s to (%s,%s)", piece.shape, self.board.cur_x+x_delta, self.board.cur_y)
 
-    def draw_tile(self, canvas, x: int, y: int, shape: Tetrominoes) -> None:
-        """On canvas dc, at pixel coordinate (x,y), draw shape. Color depends on shape.
+    # fill, light edge, and dark edge colors of each shape
+    colors = ("#000000", "#CC6666", "#66CC66", "#6666CC",
+              "#CCCC66", "#CC66CC", "#66CCCC", "#DAAA00")
+    light = ("#000000", "#F89FAB", "#79FC79", "#7979FC",
+             "#FCFC79", "#FC79FC", "#79FCFC", "#FCC600")
+    dark = ("#000000", "#803C3B", "#3B803B", "#3B3B80",
+            "#80803B", "#803B80", "#3B8080", "#806200")
+
+    def draw_tile(self, canvas, x: int, y: int, shape: Tetrominoes) -> Tuple[int, ...]:
+        """On canvas, at pixel coordinate (x,y), draw shape. Color depends on shape, and the tile
+        is created hidden if shape is NoShape
+
+        Returns:
+            The ids of the canvas items of the tile, for set_tile() to change it later
         """
-        colors = ["#000000", "#CC6666", "#66CC66", "#6666CC",
-                  "#CCCC66", "#CC66CC", "#66CCCC", "#DAAA00"]
-        light = ["#000000", "#F89FAB", "#79FC79", "#7979FC",
-                 "#FCFC79", "#FC79FC", "#79FCFC", "#FCC600"]
-        dark = ["#000000", "#803C3B", "#3B803B", "#3B3B80",
-                "#80803B", "#803B80", "#3B8080", "#806200"]
         W, H = self.tile_width, self.tile_height
-        # draw left and bottom edge, with light color
-        canvas.create_line(x, y+H-1, x, y, fill=light[shape])
-        canvas.create_line(x, y, x+W-1, y, fill=light[shape])
-        # draw top and right edge, with dark color
-        canvas.create_line(x+1, y+H-1, x+W-1, y+H-1, fill=dark[shape])
-        canvas.create_line(x+W-1, y+H-1, x+W-1, y+1, fill=dark[shape])
-        # fill square
-        canvas.create_rectangle(x+1, y+1, x+W-1, y+H-1, fill=colors[shape])
+        items = (
+            # left and bottom edge, with light color
+            canvas.create_line(x, y+H-1, x, y),
+            canvas.create_line(x, y, x+W-1, y),
+            # top and right edge, with dark color
+            canvas.create_line(x+1, y+H-1, x+W-1, y+H-1),
+            canvas.create_line(x+W-1, y+H-1, x+W-1, y+1),
+            # filled square
+            canvas.create_rectangle(x+1, y+1, x+W-1, y+H-1),
+        )
+        self.set_tile(canvas, items, shape)
+        return items
+
+    def set_tile(self, canvas, items: Tuple[int, ...], shape: Tetrominoes) -> None:
+        """Recolor the tile of canvas items from draw_tile() to shape, or hide it if NoShape"""
+        if shape == Tetrominoes.NoShape:
+            for item in items:
+                canvas.itemconfigure(item, state=tkinter.HIDDEN)
+            return
+        light, dark = self.light[shape], self.dark[shape]
+        canvas.itemconfigure(items[0], fill=light, state=tkinter.NORMAL)
+        canvas.itemconfigure(items[1], fill=light, state=tkinter.NORMAL)
+        canvas.itemconfigure(items[2], fill=dark, state=tkinter.NORMAL)
+        canvas.itemconfigure(items[3], fill=dark, state=tkinter.NORMAL)
+        canvas.itemconfigure(items[4], fill=self.colors[shape], state=tkinter.NORMAL)
+
+    def make_grid(self, leftmargin: int, topmargin: int) -> None:
+        """Start from a clean canvas with the gameboard border and one hidden tile on each cell,
+        which Refresh() only recolors afterwards"""
+        self.gamecanvas.delete("all")
+        self.gamecanvas.create_rectangle(leftmargin-1, topmargin-1,
+                leftmargin+1+self.board.nTilesH*self.tile_width,
+                topmargin+1+self.board.nTilesV*self.tile_height)
+        self.cells = []
+        for j in range(self.board.nTilesV): # for each square vertically up, same order as board
+            for i in range(self.board.nTilesH): # for each square horizontally right
+                # find coordinate on canvas for upper left corner of this tile
+                x = i * self.tile_width + leftmargin
+                y = (self.board.nTilesV - j - 1) * self.tile_height + topmargin
+                self.cells.append(self.draw_tile(self.gamecanvas, x, y, Tetrominoes.NoShape))
+        self.shown = bytearray(len(self.cells))
 
     def Refresh(self):
         """Paint event handler. Triggered when window's contents need to be repainted. Canvas
-        coordinate is x going positive toward right and y going positive downwards
+        coordinate is x going positive toward right and y going positive downwards. The canvas
+        items are created once and only those of the cells that changed are updated
         """
         # update text component
         self.scorelabel.config(text=str(self.board.score))
         self.levellabel.config(text=str(self.board.level))
         self.rowslabel.config(text=str(self.board.rows_completed))
-        # prepare canvas
+        # prepare canvas, skip all the debug logging below if not needed
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
         height, width = self.gamecanvas.winfo_height(), self.gamecanvas.winfo_width()
         topmargin = (height - self.board.nTilesV * self.tile_height) // 2
         leftmargin = (width - self.board.nTilesH * self.tile_width) // 2
-        logging.debug("canvas width=%d, height=%d", width, height)
-        logging.debug("topmargin=%d, leftmargin=%d, tile width=%d, height=%d", topmargin,
-                leftmargin, self.tile_width, self.tile_height)
-        # draw gameboard border
-        self.gamecanvas.delete("all") # quick and dirty way to start from a clean canvas
-        self.gamecanvas.create_rectangle(leftmargin-1, topmargin-1,
-                leftmargin+1+self.board.nTilesH*self.tile_width,
-                topmargin+1+self.board.nTilesV*self.tile_height)
-        logging.debug("draw rectangle (%d,%d)--(%d,%d)", leftmargin-1, topmargin-1,
-                leftmargin+1+self.board.nTilesH*self.tile_width,
-                topmargin+1+self.board.nTilesV*self.tile_height)
-        # draw whatever on the tetris board
-        for j in range(self.board.nTilesV): # for each square vertically down
-            for i in range(self.board.nTilesH): # for each square horizontally right
-                # find coordinate on canvas for upper left corner of this tile. wx.DC has (0,0) at top left corner
-                x = i * self.tile_width + leftmargin
-                y = (self.board.nTilesV - j - 1) * self.tile_height + topmargin
-                if self.board[i, j] != Tetrominoes.NoShape:
-                    self.draw_tile(self.gamecanvas, x, y, self.board[i, j])
-                    logging.debug("gameboard draw (%s,%s) shape %s", x, y, self.board[i, j])
-        # draw the dropping piece: 4 tiles
-        if self.board.this_piece.shape != Tetrominoes.NoShape:
-            xs = [(self.board.cur_x + x) * self.tile_width for x in self.board.this_piece.x]
-            ys = [(self.board.nTilesV - (self.board.cur_y + y) - 1) * self.tile_height for y in self.board.this_piece.y]
-            for x, y in zip(xs, ys):
-                self.draw_tile(self.gamecanvas, leftmargin+x, topmargin+y, self.board.this_piece.shape)
-                logging.debug("gameboard draw (%s,%s) shape %s", leftmargin+x, topmargin+y, self.board.this_piece.shape)
+        geometry = (leftmargin, topmargin, self.tile_width, self.tile_height)
+        if geometry != self.geometry:
+            # first paint, or the canvas is resized: create all items again
+            if debug:
+                logging.debug("canvas width=%d, height=%d", width, height)
+                logging.debug("topmargin=%d, leftmargin=%d, tile width=%d, height=%d", topmargin,
+                        leftmargin, self.tile_width, self.tile_height)
+            self.make_grid(leftmargin, topmargin)
+            self.geometry = geometry
+            self.hint = None
+        # what should be on the tetris board: the fixed tiles and the dropping piece
+        shown = bytearray(self.board.colors)
+        piece = self.board.this_piece
+        if piece.shape != Tetrominoes.NoShape:
+            for x, y in piece.coords:
+                i, j = self.board.cur_x + x, self.board.cur_y + y
+                if 0 <= i < self.board.nTilesH and 0 <= j < self.board.nTilesV:
+                    shown[j * self.board.nTilesH + i] = piece.shape
+        # update only the tiles that changed since last paint
+        for k, (old, new) in enumerate(zip(self.shown, shown)):
+            if old != new:
+                self.set_tile(self.gamecanvas, self.cells[k], new)
+                if debug:
+                    logging.debug("gameboard update (%s,%s) shape %s", k % self.board.nTilesH,
+                            k // self.board.nTilesH, new)
+        self.shown = shown
+        # draw the next piece, only when it changed
+        hint = (self.board.next_piece, self.tile_width, self.tile_height)
+        if hint == self.hint:
+            return
+        self.hint = hint
         # draw the square to hold the next piece
         center_x, center_y = 45, 45
         self.hintcanvas.delete("all")
         self.hintcanvas.create_rectangle(1, 1, 88, 88, fill="#F0F0F0")
         # position the piece at center
-        min_x, min_y = min(self.board.next_piece.x), min(self.board.next_piece.y)
-        shape_width = (max(self.board.next_piece.x) + 1 - min_x) * self.tile_width
-        shape_height = (max(self.board.next_piece.y) + 1 - min_y) * self.tile_height
+        min_x, max_x, min_y, max_y = self.board.next_piece.extent
+        shape_width = (max_x + 1 - min_x) * self.tile_width
+        shape_height = (max_y + 1 - min_y) * self.tile_height
         offset_x = center_x - shape_width // 2 - min_x * self.tile_width
         offset_y = center_y + shape_height // 2 + (min_y-1) * self.tile_height
         xs = [offset_x+x * self.tile_width for x in self.board.next_piece.x]
         ys = [offset_y-y * self.tile_height for y in self.board.next_piece.y]
         for x, y in zip(xs, ys):
-            logging.debug("dashboard draw (%s,%s) shape %s", x, y, self.board.next_piece.shape)
+            if debug:
+                logging.debug("dashboard draw (%s,%s) shape %s", x, y, self.board.next_piece.shape)
             self.draw_tile(self.hintcanvas, x, y, self.board.next_piece.shape)
 
     def OnTimer(self):
-        """Timer fire: normally move one line down (like D key event), otherwise
-        produce new shape
+        """Timer fire on every display frame: advance the game to the current time, which normally
+        move one line down (like D key event) or produce new shape once in a while, then repaint
+        if anything changed
         """
-        if self.board.neednewpiece:
-            # first timer after full row is removed, generate new piece instead of moving down
-            if self.board.make_new_piece():
-                logging.debug("This: %s; next: %s", self.board.this_piece.shape, self.board.next_piece.shape)
-            else:
-                # cannot even place the shape at top middle of the board, finish the game
-                self.timer = None
-                self.message.config(text="Game over")
-                self.config(bg="#E1E1E1")
-                logging.debug("game over")
-                return # do not restart timer
-        else:
-            # normal: move the current piece down for one row
-            logging.debug("moving piece down, curr_y = %d", self.board.cur_y)
-            self.move_down()
+        if self.loop.frame():
+            self.Refresh()
+        if not self.board.started:
+            # cannot even place the shape at top middle of the board, finish the game
+            self.timer = None
+            self.message.config(text="Game over")
+            self.config(bg="#E1E1E1")
+            logging.debug("game over")
+            return # do not restart timer
         # re-fire
         if self.timer:
             self.parent.after_cancel(self.timer) # in case after already set up
-        self.timer = self.parent.after(self.speed, self.OnTimer)
+        self.timer = self.parent.after(self.interval, self.OnTimer)
 
     def OnKeyDown(self, event):
         """Left/right/up/down key for move and rotate, space for drop, d for one
-        line down, p for pause, all other ignore (pass on to next handler)
+        line down, p for pause, a for demo mode, all other ignore (pass on to next handler)
         """
         if not self.board.started or self.board.this_piece.shape == Tetrominoes.NoShape:
             logging.debug("not started - ignore input")
@@ -535,6 +302,10 @@ class Tetris(tkinter.Frame):
             self.drop_down()
         elif event.char in ["D", "d"]:
             self.move_down()
+        elif event.char in ["A", "a"]:
+            # demo mode: toggle the AI player
+            from tetris.ai import ai_policy # on first use only, as it imports NumPy
+            self.loop.player = None if self.loop.player else ai_policy
 
 def main():
     root = tkinter.Tk()
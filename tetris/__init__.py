@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+"""
+Tetris game engine. It has no dependency on any GUI library, so it is shared by all the front ends
+as well as headless use of the game.
+"""
+
+from .shape import Tetrominoes, Shape
+from .board import TetrisBoard, TetrisBitBoard, TetrisSparseBoard
+from .randomizer import (Randomizer, UniformRandomizer, BagRandomizer, HistoryRandomizer,
+                         SequenceRandomizer, make_randomizer)
+from .game import TetrisGame, TetrisSparseGame
+from .loop import GameLoop
+from .placement import Placement, placements
+
+__all__ = ["Tetrominoes", "Shape", "TetrisBoard", "TetrisBitBoard", "TetrisSparseBoard",
+           "TetrisGame", "TetrisSparseGame", "GameLoop", "Randomizer", "UniformRandomizer",
+           "BagRandomizer", "HistoryRandomizer", "SequenceRandomizer", "make_randomizer",
+           "Placement", "placements"]
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+"""
+Heuristic AI player. Every placement of the current piece is scored by a weighted sum of features
+of the resulting board: aggregate height, number of holes, bumpiness, and the number of rows
+cleared, and the piece is moved to the best one. All candidate boards of a piece are scored in one
+batch with NumPy if it is installed, otherwise one by one in pure Python.
+
+The lookahead player also places the next piece, as shown in the preview, after each of the best
+placements of the current piece, and picks by the best score of the two pieces together. It can
+search deeper, with the pieces after the preview averaged over all shapes.
+"""
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import List, NamedTuple, Optional, Sequence
+import logging
+import sys
+import time
+
+try:
+    import numpy
+except ImportError: # optional, scored in pure Python without it
+    numpy = None
+
+from .shape import Tetrominoes, Shape
+from .board import TetrisBoard
+from .game import TetrisGame
+from .placement import Placement, placements, placements_on
+from .randomizer import SHAPES
+
+logger = logging.getLogger(__name__)
+
+class Weights(NamedTuple):
+    """Weight of each board feature in the score of a placement. The defaults are those Yiyuan
+    Lee found for his Tetris AI by a genetic algorithm"""
+    height: float = -0.510066    # sum of the heights of all columns
+    lines: float = 0.760666      # number of rows cleared
+    holes: float = -0.35663      # number of empty tiles with an occupied tile above in the column
+    bumpiness: float = -0.184483 # sum of the height differences of adjacent columns
+
+def _score_python(candidates: Sequence[Placement], width: int, weights: Weights) -> List[float]:
+    """Score the placements one by one from their row bitmasks"""
+    scores = []
+    for candidate in candidates:
+        heights = [0] * width
+        filled = 0
+        for y, row in enumerate(candidate.rows):
+            if not row:
+                continue
+            filled += bin(row).count("1")
+            for x in range(width):
+                if row >> x & 1:
+                    heights[x] = y + 1
+        total = sum(heights)
+        holes = total - filled # every occupied tile is below the height of its column
+        bumpiness = sum(abs(a - b) for a, b in zip(heights, heights[1:]))
+        scores.append(weights.height * total + weights.lines * candidate.cleared
+                      + weights.holes * holes + weights.bumpiness * bumpiness)
+    return scores
+
+def _score_numpy(candidates: Sequence[Placement], width: int, weights: Weights) -> List[float]:
+    """Score all placements at once, with the boards unpacked into an array of tiles of shape
+    (candidates, height, width)"""
+    rows = numpy.array([candidate.rows for candidate in candidates], dtype=numpy.uint64)
+    tiles = (rows[:, :, None] >> numpy.arange(width, dtype=numpy.uint64)) & numpy.uint64(1)
+    occupied = tiles.astype(bool)
+    height = occupied.shape[1]
+    # height of a column is one above its highest occupied tile, or 0 if the column is empty
+    top = height - numpy.argmax(occupied[:, ::-1, :], axis=1)
+    heights = numpy.where(occupied.any(axis=1), top, 0)
+    total = heights.sum(axis=1)
+    holes = total - occupied.sum(axis=(1, 2))
+    bumpiness = numpy.abs(numpy.diff(heights, axis=1)).sum(axis=1)
+    cleared = numpy.array([candidate.cleared for candidate in candidates])
+    scores = (weights.height * total + weights.lines * cleared
+              + weights.holes * holes + weights.bumpiness * bumpiness)
+    return scores.tolist()
+
+def score(candidates: Sequence[Placement], width: int,
+          weights: Weights = Weights()) -> List[float]:
+    """Score the placements on a board of the given width, higher is better. Boards up to 64
+    columns wide are scored in one batch with NumPy if available
+
+    Returns:
+        The score of each placement, in the same order
+    """
+    if not candidates:
+        return []
+    if numpy is not None and width <= 64:
+        return _score_numpy(candidates, width, weights)
+    return _score_python(candidates, width, weights)
+
+def best_placement(board: TetrisBoard, piece: Shape,
+                   weights: Weights = Weights()) -> Optional[Placement]:
+    """Find the placement of the piece with the highest score, or None if it cannot be placed
+    anywhere. Ties go to the first in the order of placements()"""
+    candidates = placements(board, piece)
+    if not candidates:
+        return None
+    scores = score(candidates, board.nTilesH, weights)
+    return candidates[max(range(len(scores)), key=scores.__getitem__)]
+
+def moves_to(game: TetrisGame, target: Placement) -> List[str]:
+    """The inputs to move the current piece of the game to the target placement: rotate, shift,
+    then drop"""
+    turns = (target.piece.rotation - game.this_piece.rotation) % 4
+    moves = ["ccw"] if turns == 3 else ["cw"] * turns
+    shift = target.x - game.cur_x
+    moves += ["left" if shift < 0 else "right"] * abs(shift)
+    moves.append("drop")
+    return moves
+
+def ai_policy(game: TetrisGame) -> List[str]:
+    """Policy of the heuristic AI player, for the simulator or the demo mode of the GUI: move the
+    current piece to its best placement, or drop it where it is if there is none"""
+    target = best_placement(game, game.this_piece)
+    if target is None:
+        logger.debug("no placement for %s", game.this_piece)
+        return ["drop"]
+    return moves_to(game, target)
+
+class TranspositionTable:
+    """Cache of the values of searched positions, i.e., a board and the piece to place on it, such
+    that a position reached again, on another branch or on a later move, is not searched again. A
+    position is keyed by an integer from the 64-bit Zobrist hash of the board, see rows_key(). The
+    least recently used entries are evicted when the estimated memory use exceeds a cap.
+    """
+    entry_overhead = 150 # bytes of an entry besides its key, i.e., the dict slot, links and value
+
+    def __init__(self, max_bytes: int = 16 << 20):
+        """Create an empty table that holds up to about max_bytes of memory"""
+        self.max_bytes = max_bytes
+        self.bytes = 0  # estimated memory used by the entries
+        self.hits = 0
+        self.misses = 0
+        self._entries : OrderedDict[int, float] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def entry_size(self, key: int) -> int:
+        """Estimate the memory of an entry"""
+        return self.entry_overhead + sys.getsizeof(key)
+
+    def get(self, key: int) -> Optional[float]:
+        """Look up the value of a position and mark it recently used, or None if not cached"""
+        value = self._entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: int, value: float) -> None:
+        """Cache the value of a position, evicting the least recently used ones if over the cap"""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+        else:
+            self.bytes += self.entry_size(key)
+        self._entries[key] = value
+        while self.bytes > self.max_bytes and self._entries:
+            old, _ = self._entries.popitem(last=False)
+            self.bytes -= self.entry_size(old)
+
+    def clear(self) -> None:
+        """Remove all entries"""
+        self._entries.clear()
+        self.bytes = 0
+
+class LookaheadPlayer:
+    """Policy that searches the current and the next pieces, as many as the depth. The placements
+    of the current piece are scored as by best_placement(), and the best few of them, as many as
+    the beam width, are searched further with the next piece placed after it, and so on. The
+    pieces after the preview are not known, and the value of a position is averaged over all
+    shapes for them. The one with the best score of all pieces is chosen. The search stops early
+    if it exceeds the time budget per move in seconds, checked between the placements of the
+    current piece, with the best found so far, which is the best of a single piece if nothing
+    searched further. Without a time budget, the choice depends only on the game.
+    """
+    def __init__(self, weights: Weights = Weights(), beam: int = 8, budget: Optional[float] = None,
+                 table: Optional[TranspositionTable] = None, depth: int = 2):
+        self.weights = weights
+        self.beam = beam
+        self.budget = budget
+        self.table = table if table is not None else TranspositionTable()
+        self.depth = depth # number of pieces searched, 1 for the current piece only
+
+    def __call__(self, game: TetrisGame) -> List[str]:
+        """Policy for the simulator or the demo mode of the GUI"""
+        target = self.best_placement(game)
+        if target is None:
+            logger.debug("no placement for %s", game.this_piece)
+            return ["drop"]
+        return moves_to(game, target)
+
+    def best_placement(self, game: TetrisGame) -> Optional[Placement]:
+        """Find the placement of the current piece with the best score after the next piece"""
+        deadline = None if self.budget is None else time.perf_counter() + self.budget
+        width = game.nTilesH
+        candidates = placements(game, game.this_piece)
+        if not candidates:
+            return None
+        scores = score(candidates, width, self.weights)
+        order = sorted(range(len(candidates)), key=scores.__getitem__, reverse=True)
+        best = candidates[order[0]]
+        if game.next_piece.shape == Tetrominoes.NoShape or self.depth < 2:
+            return best
+        best_value = None
+        for i in order[:self.beam]:
+            if deadline is not None and time.perf_counter() > deadline:
+                logger.debug("out of time budget, searched %d placements", i)
+                break
+            candidate = candidates[i]
+            value = (self.weights.lines * candidate.cleared
+                     + self.value(candidate, game.next_piece.shape, self.depth - 1, game))
+            if best_value is None or value > best_value:
+                best, best_value = candidate, value
+        return best
+
+    def value(self, candidate: Placement, shape: Tetrominoes, depth: int,
+              game: TetrisGame) -> float:
+        """Best score of placing a piece of the shape after the candidate placement, and as many
+        unknown pieces after it as to search depth pieces in total, or -inf if it cannot be placed
+        at all. It is cached by the hash of the board, the shape and the depth"""
+        key = (candidate.key << 8) | (depth << 3) | shape
+        value = self.table.get(key)
+        if value is None:
+            width, weights = game.nTilesH, self.weights
+            nexts = placements_on(candidate.rows, candidate.heights, width, game.nTilesV,
+                                  Shape.table[shape][0], candidate.key)
+            scores = score(nexts, width, weights)
+            value = max(scores, default=float("-inf"))
+            if depth > 1 and nexts:
+                order = sorted(range(len(nexts)), key=scores.__getitem__, reverse=True)
+                value = max(weights.lines * nexts[i].cleared
+                            + sum(self.value(nexts[i], after, depth - 1, game) for after in SHAPES)
+                            / len(SHAPES)
+                            for i in order[:self.beam])
+            self.table.put(key, value)
+        return value
+
+# lookahead player with the default settings, as the policy "lookahead" of the simulator
+lookahead_policy = LookaheadPlayer()
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
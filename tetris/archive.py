@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Archive of many replays in a single file. The file starts with a fixed-width header and index,
+which gives the key, e.g., the seed, and the offset and length of the replay of each game, followed
+by the replays as written by ReplayRecorder. An archive is read through mmap: looking up a game
+reads only its index entry, and the replay is a memoryview into the mapped file that is decoded in
+place, or wrapped by numpy.frombuffer() without a copy. Run as
+
+    python3 -m tetris.archive pack games.ttra replays/*.ttr
+    python3 -m tetris.archive stats games.ttra
+
+The header is the magic bytes, the format version and the size of an index entry as 16-bit, and
+the number of games as 64-bit integer. Each index entry is the key, offset and length as 64-bit
+integers. All are little-endian.
+"""
+from __future__ import annotations
+
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Union
+import argparse
+import csv
+import mmap
+import os
+import struct
+import sys
+
+from .replay import ReplayPlayer, ReplayReader, PIECE
+
+MAGIC = b"TTRA"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQ") # magic, version, entry size, number of games
+ENTRY = struct.Struct("<QQQ")    # key, offset, length
+
+class ArchiveEntry(NamedTuple):
+    """Index entry of a game in an archive"""
+    key: int     # the key given when added, e.g., the seed of the game
+    offset: int  # position of the replay in the file
+    length: int  # size of the replay in bytes
+
+class ArchiveWriter:
+    """Write replays into an archive file from its start. The index is reserved for as many games
+    as the capacity in front, and filled on close(), such that the replays are written one at a time
+    without holding them in memory.
+    """
+    def __init__(self, stream: BinaryIO, capacity: int):
+        self.stream = stream
+        self.capacity = capacity
+        self.entries : List[ArchiveEntry] = []
+        stream.write(bytes(HEADER.size + ENTRY.size * capacity))
+
+    def __enter__(self) -> ArchiveWriter:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def add(self, key: int, replay: Union[bytes, memoryview]) -> None:
+        """Append the replay of a game, as written by ReplayRecorder"""
+        if len(self.entries) >= self.capacity:
+            raise ValueError("Archive is full, capacity is %d games" % self.capacity)
+        offset = self.stream.tell()
+        self.stream.write(replay)
+        self.entries.append(ArchiveEntry(key, offset, len(replay)))
+
+    def close(self) -> None:
+        """Write the header and index"""
+        end = self.stream.tell()
+        self.stream.seek(0)
+        self.stream.write(HEADER.pack(MAGIC, VERSION, ENTRY.size, len(self.entries)))
+        self.stream.write(b"".join(ENTRY.pack(*entry) for entry in self.entries))
+        self.stream.seek(end)
+
+class ReplayArchive:
+    """Read-only access to an archive file through mmap. The replays are memoryviews into the
+    mapped file, which must be released before close().
+    """
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, entry_size, count = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a replay archive, bad magic bytes" % path)
+        if version != VERSION or entry_size != ENTRY.size:
+            self.close()
+            raise ValueError("%s is archive version %d, only %d is supported"
+                             % (path, version, VERSION))
+        self.count = count
+        self._view = memoryview(self._map)
+        self._keys : Optional[Dict[int, int]] = None # index by key, built on first find()
+
+    def __enter__(self) -> ReplayArchive:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int) -> memoryview:
+        """The replay of the i-th game, without copying"""
+        _, offset, length = self.entry(i)
+        return self._view[offset:offset+length]
+
+    def __iter__(self) -> Iterator[memoryview]:
+        for i in range(self.count):
+            yield self[i]
+
+    def entry(self, i: int) -> ArchiveEntry:
+        """Index entry of the i-th game"""
+        if not 0 <= i < self.count:
+            raise IndexError("Game %d out of range of %d games" % (i, self.count))
+        return ArchiveEntry(*ENTRY.unpack_from(self._map, HEADER.size + ENTRY.size * i))
+
+    def find(self, key: int) -> int:
+        """Index of the game with the key, or KeyError if none"""
+        if self._keys is None:
+            self._keys = {self.entry(i).key: i for i in range(self.count)}
+        return self._keys[key]
+
+    def reader(self, i: int) -> ReplayReader:
+        """Decoder of the events of the i-th game"""
+        return ReplayReader(self[i])
+
+    def player(self, i: int, snapshot_every: int = 600) -> ReplayPlayer:
+        """Player to re-simulate the i-th game"""
+        return ReplayPlayer(self[i], snapshot_every)
+
+    def close(self) -> None:
+        if hasattr(self, "_view"):
+            self._view.release()
+        try:
+            self._map.close()
+        except BufferError:
+            pass # views still in use, e.g., on an exception, it is unmapped when they are freed
+        self._file.close()
+
+def pack(path: str, replays: List[str]) -> int:
+    """Write replay files into an archive, keyed by the file name if it is an integer, e.g., the
+    seed as written by the simulator, otherwise by the order given
+
+    Returns:
+        The number of games written
+    """
+    with open(path, "wb") as stream, ArchiveWriter(stream, len(replays)) as writer:
+        for i, name in enumerate(replays):
+            stem = os.path.splitext(os.path.basename(name))[0]
+            with open(name, "rb") as replay:
+                writer.add(int(stem) if stem.isdigit() else i, replay.read())
+    return len(replays)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Pack and scan archives of Tetris replays")
+    commands = parser.add_subparsers(dest="command", required=True)
+    packer = commands.add_parser("pack", help="write replay files into an archive")
+    packer.add_argument("archive", help="archive file to write")
+    packer.add_argument("replays", nargs="+", help="replay files")
+    stats = commands.add_parser("stats", help="print the statistics of each game in CSV")
+    stats.add_argument("archive", help="archive file")
+    args = parser.parse_args(argv)
+
+    if args.command == "pack":
+        count = pack(args.archive, args.replays)
+        print("%d games in %d bytes" % (count, os.path.getsize(args.archive)), file=sys.stderr)
+        return
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["key", "bytes", "events", "pieces", "ticks"])
+    with ReplayArchive(args.archive) as archive:
+        for i in range(len(archive)):
+            reader = archive.reader(i)
+            events = pieces = 0
+            for event in reader:
+                events += 1
+                pieces += event.code == PIECE
+            writer.writerow([archive.entry(i).key, archive.entry(i).length, events, pieces,
+                             reader.tick])
+            del reader # release the view into the archive
+
+if __name__ == "__main__":
+    main()
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
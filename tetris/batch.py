@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Many games of Tetris stepped in lock-step on one NumPy array of shape (games, height, width), e.g.,
+as environments for reinforcement learning. Each step applies one input to every game, with the
+same rules as the headless simulator, but the collision checks, fixing of pieces and removal of
+full rows are vectorized across all the games instead of run on one TetrisGame at a time.
+
+This module needs NumPy, which the rest of the package does not.
+"""
+from __future__ import annotations
+
+from typing import Optional, Sequence
+import copy
+
+import numpy
+
+from .shape import Tetrominoes, Shape
+from .game import TetrisGame
+from .randomizer import Randomizer, make_randomizer
+
+# Input of each game on a step, as index into this tuple. Same as MOVES of the game, plus no
+# input at all
+ACTIONS = ("none", "left", "right", "cw", "ccw", "down", "drop")
+NONE, LEFT, RIGHT, CW, CCW, DOWN, DROP = range(len(ACTIONS))
+
+# coordinates of the tiles of each shape at each rotation, shape (shapes, 4, tiles, 2)
+COORDS = numpy.array(Shape.rotations, dtype=numpy.int64)
+
+class TetrisBatch:
+    """A batch of games on a (games, height, width) uint8 array of tiles, holding the integer
+    value of Tetrominoes same as the color plane of TetrisBitBoard. The state of the games are
+    arrays indexed by game, and most methods operate on the games given by an array of indices.
+    """
+    chunk = 256 # number of pieces drawn in bulk from the randomizer of a game at a time
+    def __init__(self, n_games: int, width: int = 10, height: int = 18,
+                 randomizers: Optional[Sequence[Randomizer]] = None):
+        """Create a batch of games. Each game draws its pieces from its own randomizer, which
+        defaults to UniformRandomizer seeded by the index of the game"""
+        if randomizers is None:
+            randomizers = [make_randomizer("uniform", i) for i in range(n_games)]
+        if len(randomizers) != n_games:
+            raise ValueError("Need one randomizer per game, got %d for %d games"
+                             % (len(randomizers), n_games))
+        self.n_games = n_games
+        self.nTilesH = width
+        self.nTilesV = height
+        self.randomizers = list(randomizers)
+        self.tiles = numpy.zeros((n_games, height, width), dtype=numpy.uint8)
+        # the current piece, as the shape and rotation index to Shape.table, and its position
+        self.shape = numpy.zeros(n_games, dtype=numpy.int64)
+        self.rotation = numpy.zeros(n_games, dtype=numpy.int64)
+        self.cur_x = numpy.zeros(n_games, dtype=numpy.int64)
+        self.cur_y = numpy.zeros(n_games, dtype=numpy.int64)
+        self.next_shape = numpy.zeros(n_games, dtype=numpy.int64)
+        # state of each game, same as the attributes of TetrisGame
+        self.started = numpy.zeros(n_games, dtype=bool)
+        self.neednewpiece = numpy.zeros(n_games, dtype=bool)
+        self.rows_completed = numpy.zeros(n_games, dtype=numpy.int64)
+        self.pieces = numpy.zeros(n_games, dtype=numpy.int64)
+        # pieces drawn from the randomizer of each game, and the index of the next one to use
+        self._queue = numpy.zeros((n_games, self.chunk), dtype=numpy.uint8)
+        self._queued = numpy.full(n_games, self.chunk)
+
+    def all_games(self) -> numpy.ndarray:
+        """Indices of all games"""
+        return numpy.arange(self.n_games)
+
+    def start(self, games: Optional[numpy.ndarray] = None) -> None:
+        """Start or restart the games, all if not given, with empty boards and the first piece"""
+        if games is None:
+            games = self.all_games()
+        self.tiles[games] = 0
+        self.started[games] = True
+        self.neednewpiece[games] = False
+        self.rows_completed[games] = 0
+        self.pieces[games] = 0
+        self.shape[games] = Tetrominoes.NoShape
+        self.draw_next(games)
+        self.make_new_piece(games)
+
+    def draw_next(self, games: numpy.ndarray) -> None:
+        """Draw the next piece of the games from their randomizers, refilling the queue of
+        pieces of a game from its randomizer in bulk when it is used up"""
+        empty = games[self._queued[games] >= self.chunk]
+        for i in empty.tolist():
+            self._queue[i] = numpy.frombuffer(self.randomizers[i].generate(self.chunk),
+                                              dtype=numpy.uint8)
+        self._queued[empty] = 0
+        self.next_shape[games] = self._queue[games, self._queued[games]]
+        self._queued[games] += 1
+
+    def check_pos(self, games: numpy.ndarray, shape: numpy.ndarray, rotation: numpy.ndarray,
+                  x: numpy.ndarray, y: numpy.ndarray) -> numpy.ndarray:
+        """Check the validity of placing a piece at a position on each of the games, same as
+        TetrisBoard.check_pos(): tiles above the board are not checked but not all of them
+
+        Returns:
+            Boolean array for whether the position is valid on each game
+        """
+        coords = COORDS[shape, rotation]            # (games, tiles, 2)
+        cx = x[:, None] + coords[:, :, 0]
+        cy = y[:, None] + coords[:, :, 1]
+        inside = cy < self.nTilesV
+        outside = inside & ((cx < 0) | (cx >= self.nTilesH) | (cy < 0))
+        cx = numpy.clip(cx, 0, self.nTilesH - 1)
+        cy = numpy.clip(cy, 0, self.nTilesV - 1)
+        collide = inside & (self.tiles[games[:, None], cy, cx] != 0)
+        return inside.any(axis=1) & ~(outside | collide).any(axis=1)
+
+    def try_pos(self, games: numpy.ndarray, rotation: numpy.ndarray, x: numpy.ndarray,
+                y: numpy.ndarray) -> numpy.ndarray:
+        """Move the current piece of each game to the rotation and position if it is valid
+
+        Returns:
+            Boolean array for whether each game has moved
+        """
+        ok = self.check_pos(games, self.shape[games], rotation, x, y)
+        moved = games[ok]
+        self.rotation[moved] = rotation[ok]
+        self.cur_x[moved] = x[ok]
+        self.cur_y[moved] = y[ok]
+        return ok
+
+    def make_new_piece(self, games: numpy.ndarray) -> None:
+        """Enter the next piece at top middle of the board of each game. The games that cannot
+        place it are over"""
+        self.neednewpiece[games] = False
+        shape = self.next_shape[games]
+        x = numpy.full(len(games), self.nTilesH // 2)
+        y = numpy.full(len(games), self.nTilesV - 1)
+        rotation = numpy.zeros(len(games), dtype=numpy.int64)
+        ok = self.check_pos(games, shape, rotation, x, y)
+        placed, over = games[ok], games[~ok]
+        self.shape[placed] = shape[ok]
+        self.rotation[placed] = 0
+        self.cur_x[placed] = x[ok]
+        self.cur_y[placed] = y[ok]
+        self.pieces[placed] += 1
+        self.draw_next(placed)
+        self.shape[over] = Tetrominoes.NoShape
+        self.started[over] = False
+
+    def fix_pos(self, games: numpy.ndarray) -> None:
+        """Fix the current piece of each game into its board, ignoring tiles above the top"""
+        shape = self.shape[games]
+        coords = COORDS[shape, self.rotation[games]]
+        cx = self.cur_x[games, None] + coords[:, :, 0]
+        cy = self.cur_y[games, None] + coords[:, :, 1]
+        inside = cy < self.nTilesV
+        index = numpy.broadcast_to(games[:, None], cx.shape)
+        self.tiles[index[inside], cy[inside], cx[inside]] = numpy.broadcast_to(
+            shape[:, None], cx.shape)[inside]
+
+    def removefull(self, games: numpy.ndarray) -> numpy.ndarray:
+        """Remove the full rows of each game, move the rows above down and fill the top with
+        empty rows. The rows are reordered by a stable sort that moves the full rows to the top,
+        which are then cleared
+
+        Returns:
+            The number of rows removed on each game
+        """
+        full = (self.tiles[games] != 0).all(axis=2)    # (games, height)
+        removed = full.sum(axis=1)
+        some = removed > 0
+        if some.any():
+            games, full, count = games[some], full[some], removed[some]
+            order = numpy.argsort(full, axis=1, kind="stable")
+            tiles = numpy.take_along_axis(self.tiles[games], order[:, :, None], axis=1)
+            tiles[numpy.arange(self.nTilesV) >= self.nTilesV - count[:, None]] = 0
+            self.tiles[games] = tiles
+        return removed
+
+    def piece_dropped(self, games: numpy.ndarray) -> None:
+        """Fix the current piece of each game, remove full rows, and hint for a new piece"""
+        self.fix_pos(games)
+        self.neednewpiece[games] = True
+        self.shape[games] = Tetrominoes.NoShape
+        self.rotation[games] = 0
+        self.rows_completed[games] += self.removefull(games)
+
+    def one_row_down(self, games: numpy.ndarray) -> numpy.ndarray:
+        """Move the current piece of each game one row down, or drop it if it cannot
+
+        Returns:
+            Boolean array for whether each game has moved
+        """
+        ok = self.try_pos(games, self.rotation[games], self.cur_x[games], self.cur_y[games] - 1)
+        self.piece_dropped(games[~ok])
+        return ok
+
+    def hard_drop(self, games: numpy.ndarray) -> None:
+        """Drop the current piece of each game straight down and fix it. The positions of falling
+        every number of rows up to the board height are checked at once, and the piece falls
+        until the first invalid one"""
+        if len(games):
+            height = self.nTilesV
+            repeat = lambda a: numpy.repeat(a, height)
+            y = (self.cur_y[games, None] - numpy.arange(1, height + 1)).ravel()
+            ok = self.check_pos(repeat(games), repeat(self.shape[games]),
+                                repeat(self.rotation[games]), repeat(self.cur_x[games]), y)
+            ok = ok.reshape(len(games), height)
+            self.cur_y[games] -= numpy.where(ok.all(axis=1), height, numpy.argmin(ok, axis=1))
+        self.piece_dropped(games)
+
+    def step(self, actions: numpy.ndarray) -> numpy.ndarray:
+        """Advance every game by one tick, same as the headless simulator does: a game that needs
+        a new piece gets it, otherwise the input of the game, as index into ACTIONS, is applied
+        and then the piece falls one row. Games that are over are not changed
+
+        Returns:
+            The number of rows removed on each game in this step
+        """
+        before = self.rows_completed.copy()
+        games = self.all_games()
+        active = games[self.started & ~self.neednewpiece]
+        self.make_new_piece(games[self.started & self.neednewpiece]) # no input nor fall this tick
+        actions = numpy.asarray(actions)[active]
+        for action, dx, turn in ((LEFT, -1, 0), (RIGHT, 1, 0), (CW, 0, 1), (CCW, 0, -1)):
+            moving = active[actions == action]
+            if len(moving):
+                self.try_pos(moving, (self.rotation[moving] + turn) % 4,
+                             self.cur_x[moving] + dx, self.cur_y[moving])
+        self.one_row_down(active[actions == DOWN])
+        self.hard_drop(active[actions == DROP])
+        self.one_row_down(active[~self.neednewpiece[active]])
+        return self.rows_completed - before
+
+    def game(self, i: int) -> TetrisGame:
+        """Copy the state of one game into a TetrisGame, e.g., to show it in a GUI or to run a
+        policy on it. It does not share any state with the batch, and continues with a copy of
+        the randomizer"""
+        randomizer = copy.deepcopy(self.randomizers[i])
+        randomizer.prepend(self._queue[i, self._queued[i]:].tobytes())
+        game = TetrisGame(self.nTilesH, self.nTilesV, randomizer=randomizer)
+        for j, row in enumerate(self.tiles[i].tolist()):
+            for col, shape in enumerate(row):
+                if shape:
+                    game[col, j] = Tetrominoes(shape)
+        game.this_piece = Shape.table[self.shape[i]][self.rotation[i]]
+        game.next_piece = Shape.table[self.next_shape[i]][0]
+        game.cur_x, game.cur_y = int(self.cur_x[i]), int(self.cur_y[i])
+        game.started = bool(self.started[i])
+        game.neednewpiece = bool(self.neednewpiece[i])
+        game.rows_completed = int(self.rows_completed[i])
+        game.pieces = int(self.pieces[i])
+        game.level = 1
+        return game
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
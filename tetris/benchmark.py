@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""
+Microbenchmarks of the core engine operations on seeded synthetic boards of different sizes and
+fill densities. Run as
+
+    python3 -m tetris.benchmark --sizes 10x18,100x1000 --densities 0,0.5 --backends list,bit
+
+which prints one JSON object per line for each benchmark, for comparing against a previous run or
+between board backends.
+"""
+from __future__ import annotations
+
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, Type
+import argparse
+import json
+import random
+import timeit
+
+from .shape import Tetrominoes, Shape
+from .board import TetrisBoard, TetrisBitBoard, TetrisSparseBoard
+from .game import GAMES
+from .placement import placements
+from .ai import best_placement
+from .randomizer import SHAPES
+from .simulate import run_game, load_policy
+
+BACKENDS : Dict[str, Type[TetrisBoard]] = {
+    "list": TetrisBoard,
+    "bit": TetrisBitBoard,
+    "sparse": TetrisSparseBoard,
+}
+
+# A benchmark is set up with (backend, width, height, density, seed) and returns the number of
+# operations and a function that runs them once
+Benchmark = Callable[[Type[TetrisBoard], int, int, float, int], Tuple[int, Callable[[], None]]]
+
+def synthetic_board(cls: Type[TetrisBoard], width: int, height: int, density: float,
+                    seed: int) -> TetrisBoard:
+    """Create a board with the bottom fraction of rows, as given by density, filled randomly at
+    about 80% but never full, like a stack of tiles in a game"""
+    rng = random.Random(seed)
+    board = cls(width, height)
+    for y in range(int(height * density)):
+        hole = rng.randrange(width)
+        for x in range(width):
+            if x != hole and rng.random() < 0.8:
+                board[x, y] = rng.choice(SHAPES)
+    return board
+
+def game_backend(cls: Type[TetrisBoard]) -> Optional[str]:
+    """Name in GAMES of the game on the board backend, or None if there is none"""
+    return next((name for name, game in GAMES.items() if cls in game.__bases__), None)
+
+def random_positions(board: TetrisBoard, n: int, seed: int) -> List[Tuple[Shape, int, int]]:
+    """Random pieces at any orientation and position within the board"""
+    rng = random.Random(seed)
+    return [(Shape.table[rng.randint(1, 7)][rng.randrange(4)],
+             rng.randrange(board.nTilesH), rng.randrange(board.nTilesV)) for _ in range(n)]
+
+def landing(board: TetrisBoard, piece: Shape, x: int) -> Optional[int]:
+    """The lowest valid position of the piece at column x, dropping from the top, or None"""
+    y = board.nTilesV - 1
+    if not board.check_pos(piece, x, y):
+        return None
+    while board.check_pos(piece, x, y - 1):
+        y -= 1
+    return y
+
+def bench_check_pos(cls, width, height, density, seed):
+    board = synthetic_board(cls, width, height, density, seed)
+    positions = random_positions(board, 1000, seed)
+    def run():
+        check_pos = board.check_pos
+        for piece, x, y in positions:
+            check_pos(piece, x, y)
+    return len(positions), run
+
+def bench_fix_pos(cls, width, height, density, seed):
+    board = synthetic_board(cls, width, height, density, seed)
+    piece = Shape.table[Tetrominoes.TShape][0]
+    # the middle column or the nearest one the piece can land on
+    columns = sorted(range(width), key=lambda x: abs(x - width // 2))
+    x, y = next(((x, y) for x in columns for y in [landing(board, piece, x)] if y is not None),
+                (None, None))
+    if y is None:
+        return 0, lambda: None # the piece cannot be placed anywhere
+    def run():
+        # fixing at the same position again is idempotent, so the board does not change
+        fix_pos = board.fix_pos
+        for _ in range(1000):
+            fix_pos(piece, x, y)
+    return 1000, run
+
+def bench_removefull(cls, width, height, density, seed):
+    board = synthetic_board(cls, width, height, density, seed)
+    def run():
+        # no full row
+        removefull = board.removefull
+        for _ in range(1000):
+            removefull()
+    return 1000, run
+
+def bench_fill_removefull(cls, width, height, density, seed):
+    board = synthetic_board(cls, width, height, density, seed)
+    shape = Tetrominoes.IShape
+    def run():
+        # fill up the bottom row and remove it, i.e., one row is removed each time
+        for _ in range(100):
+            for x in range(width):
+                board[x, 0] = shape
+            board.removefull()
+    return 100, run
+
+def bench_clear(cls, width, height, density, seed):
+    if density:
+        return 0, lambda: None # always on an empty board
+    board = cls(width, height)
+    piece = Shape.table[Tetrominoes.TShape][0]
+    def run():
+        # a piece on an otherwise empty board, then clear it
+        for _ in range(100):
+            board.fix_pos(piece, width // 2, 1)
+            board.clear()
+    return 100, run
+
+def bench_rotate(cls, width, height, density, seed):
+    if cls is not TetrisBitBoard or density:
+        return 0, lambda: None # rotation does not depend on the board
+    pieces = [Shape.table[s][0] for s in range(1, 8)]
+    def run():
+        for _ in range(100):
+            for piece in pieces:
+                piece.rotate_cw().rotate_cw().rotate_ccw().rotate_ccw()
+    return 100 * len(pieces) * 4, run
+
+def bench_landing_row(cls, width, height, density, seed):
+    board = synthetic_board(cls, width, height, density, seed)
+    rng = random.Random(seed)
+    drops = []
+    for _ in range(1000):
+        piece = Shape.table[rng.randint(1, 7)][rng.randrange(4)]
+        min_x, max_x, _, _ = piece.extent
+        drops.append((piece, rng.randint(-min_x, width - 1 - max_x)))
+    def run():
+        landing_row = board.landing_row
+        for piece, x in drops:
+            landing_row(piece, x)
+    return len(drops), run
+
+def bench_placements(cls, width, height, density, seed):
+    board = synthetic_board(cls, width, height, density, seed)
+    pieces = [Shape.table[s][0] for s in SHAPES]
+    def run():
+        for piece in pieces:
+            placements(board, piece)
+    return len(pieces), run
+
+def bench_best_placement(cls, width, height, density, seed):
+    board = synthetic_board(cls, width, height, density, seed)
+    pieces = [Shape.table[s][0] for s in SHAPES]
+    def run():
+        for piece in pieces:
+            best_placement(board, piece)
+    return len(pieces), run
+
+def bench_piece_dropped(cls, width, height, density, seed):
+    backend = game_backend(cls)
+    if backend is None:
+        return 0, lambda: None # no game on this backend
+    game = synthetic_board(GAMES[backend], width, height, density, seed)
+    rng = random.Random(seed)
+    drops = []
+    for _ in range(100 * width): # give up if the pieces can hardly land anywhere
+        if len(drops) == 100:
+            break
+        piece = Shape.table[rng.randint(1, 7)][rng.randrange(4)]
+        x = rng.randrange(width)
+        y = landing(game, piece, x)
+        if y is None:
+            continue
+        cells = {(x + px, y + py) for px, py in piece.coords if y + py < height}
+        if any(all(game[i, j] or (i, j) in cells for i in range(width)) for _, j in cells):
+            continue # this would complete a row, which cannot be taken back out
+        drops.append((piece, x, y, cells))
+    if len(drops) < 100:
+        return 0, lambda: None # the board is too full to drop pieces on
+    def run():
+        # drop a piece and take it back out, which costs as much as fix_pos()
+        for piece, x, y, cells in drops:
+            game.this_piece, game.cur_x, game.cur_y = piece, x, y
+            game.piece_dropped()
+            for i, j in cells:
+                game[i, j] = Tetrominoes.NoShape
+    return len(drops), run
+
+def bench_batch_step(cls, width, height, density, seed):
+    if cls is not TetrisBitBoard or density:
+        return 0, lambda: None # batch has its own board and always starts empty
+    try:
+        import numpy
+        from .batch import TetrisBatch, ACTIONS
+    except ImportError:
+        return 0, lambda: None # NumPy not installed
+    n_games, steps = 1000, 100
+    batch = TetrisBatch(n_games, width, height)
+    batch.start()
+    actions = numpy.random.default_rng(seed).integers(0, len(ACTIONS), (steps, n_games))
+    def run():
+        for step in actions:
+            batch.step(step)
+            over = numpy.flatnonzero(~batch.started)
+            if len(over):
+                batch.start(over)
+    return n_games * steps, run
+
+def bench_game(cls, width, height, density, seed):
+    backend = game_backend(cls)
+    if backend is None or density:
+        return 0, lambda: None # full game always starts with an empty board
+    policy = load_policy("random")
+    def run():
+        for i in range(10):
+            run_game(seed + i, policy, width, height, max_pieces=1000, board=backend)
+    return 10, run
+
+BENCHMARKS : Dict[str, Benchmark] = {
+    "check_pos": bench_check_pos,
+    "fix_pos": bench_fix_pos,
+    "removefull": bench_removefull,
+    "fill_removefull": bench_fill_removefull,
+    "clear": bench_clear,
+    "rotate": bench_rotate,
+    "landing_row": bench_landing_row,
+    "placements": bench_placements,
+    "best_placement": bench_best_placement,
+    "piece_dropped": bench_piece_dropped,
+    "batch_step": bench_batch_step,
+    "game": bench_game,
+}
+
+def run_benchmarks(names: List[str], backends: List[str], sizes: List[Tuple[int, int]],
+                   densities: List[float], repeat: int = 5, seed: int = 0) -> Iterator[Dict]:
+    """Run each benchmark on each combination of backend, size, and density. The time per
+    operation is the best of a number of repeats
+
+    Yields:
+        A dict of the benchmark parameters and result
+    """
+    for name in names:
+        for backend in backends:
+            for width, height in sizes:
+                for density in densities:
+                    ops, func = BENCHMARKS[name](BACKENDS[backend], width, height, density, seed)
+                    if not ops:
+                        continue # not applicable
+                    best = min(timeit.repeat(func, number=1, repeat=repeat))
+                    yield {"bench": name, "backend": backend, "width": width, "height": height,
+                           "density": density, "ops": ops, "seconds": best,
+                           "ns_per_op": best / ops * 1e9}
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark the Tetris engine")
+    parser.add_argument("-b", "--bench", default=",".join(BENCHMARKS),
+                        help="comma-separated benchmarks to run, from: %s" % ", ".join(BENCHMARKS))
+    parser.add_argument("--backends", default=",".join(BACKENDS),
+                        help="comma-separated board backends, from: %s" % ", ".join(BACKENDS))
+    parser.add_argument("--sizes", default="10x18,20x40,100x1000",
+                        help="comma-separated board sizes as WIDTHxHEIGHT")
+    parser.add_argument("--densities", default="0,0.3,0.6",
+                        help="comma-separated fraction of rows filled in the synthetic boards")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="take the best of this many runs")
+    parser.add_argument("-s", "--seed", type=int, default=0, help="seed of the synthetic boards")
+    args = parser.parse_args(argv)
+
+    names = args.bench.split(",")
+    backends = args.backends.split(",")
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("Unknown benchmark %r, use any of %s" % (name, ", ".join(BENCHMARKS)))
+    for backend in backends:
+        if backend not in BACKENDS:
+            parser.error("Unknown backend %r, use any of %s" % (backend, ", ".join(BACKENDS)))
+    sizes = [tuple(int(n) for n in size.split("x")) for size in args.sizes.split(",")]
+    densities = [float(d) for d in args.densities.split(",")]
+    for result in run_benchmarks(names, backends, sizes, densities, args.repeat, args.seed):
+        print(json.dumps(result), flush=True)
+
+if __name__ == "__main__":
+    main()
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
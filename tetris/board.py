@@ -0,0 +1,719 @@
+# -*- coding: utf-8 -*-
+"""
+Tetris board to hold the fixed tiles, independent of the GUI library
+"""
+from __future__ import annotations
+
+from typing import Dict, FrozenSet, NamedTuple, Optional, Sequence, Tuple, List, Set
+from bisect import bisect_left
+import logging
+import random
+
+from .shape import Tetrominoes, Shape
+
+logger = logging.getLogger(__name__)
+
+# Zobrist keys: random 64-bit numbers for each shape at each column, 0 for NoShape, and for each
+# row index. They are drawn from generators of fixed seeds and extended on demand, so the hash of
+# a board is the same in every process and run
+MASK64 = (1 << 64) - 1
+TILE_KEYS : List[int] = []  # at index col*8 + shape
+ROW_KEYS : List[int] = []   # at index row
+_tile_rng = random.Random("tetris-tile-keys")
+_row_rng = random.Random("tetris-row-keys")
+
+def _extend_keys(width: int, height: int) -> None:
+    """Make sure there are Zobrist keys for a board of the size"""
+    while len(TILE_KEYS) < width * 8:
+        TILE_KEYS.extend([0] + [_tile_rng.getrandbits(64) for _ in range(7)])
+    while len(ROW_KEYS) < height:
+        ROW_KEYS.append(_row_rng.getrandbits(64))
+
+def _mix(rowhash: int, row: int) -> int:
+    """Hash of a row at its position on the board, from the hash of its content"""
+    return ((rowhash ^ ROW_KEYS[row]) * 0x9E3779B97F4A7C15) & MASK64
+
+def row_key(mask: int, row: int) -> int:
+    """Zobrist key of a row given by its bitmask at its position, e.g., to hash the rows of a
+    placement. It is _mix() of the mask up to 64 columns, and a wider mask is mixed in 64 bits at
+    a time"""
+    key = ROW_KEYS[row]
+    while True:
+        key = ((key ^ (mask & MASK64)) * 0x9E3779B97F4A7C15) & MASK64
+        mask >>= 64
+        if not mask:
+            return key
+
+_EMPTY_HASH : Dict[int, int] = {} # Zobrist hash of an empty board, by its height
+_BITCHARS = bytes.maketrans(bytes(range(8)), b"01111111") # shape to "0" or "1" if occupied
+
+def _empty_hash(height: int) -> int:
+    """Zobrist hash of an empty board of the height, computed once for each height"""
+    if height not in _EMPTY_HASH:
+        zobrist = 0
+        for y in range(height):
+            zobrist ^= _mix(0, y)
+        _EMPTY_HASH[height] = zobrist
+    return _EMPTY_HASH[height]
+
+class TetrisBoard:
+    """A python class overriding __setitem__ and __getitem__ to hold the state of a Tetris board
+    The coordinate system has x going positive toward right and y going positive upward
+    """
+    def __init__(self, width: int = 10, height: int = 18):
+        """Set the tiles dimension in the game board. Gameboy Tetris is 10x18"""
+        self.nTilesH = width  # i.e., row size in num of square tiles
+        self.nTilesV = height # i.e., col size in num of square tiles
+        # row major array to hold tiles, from the tile we can look up the shape
+        self.tiles : List[Tetrominoes] = []
+        # number of occupied tiles in each row, and the rows that are full, for removefull()
+        self.rowfill : List[int] = []
+        self.fullrows : Set[int] = set()
+        # height of each column, i.e., one above its highest occupied tile, or 0 if empty
+        self.heights : List[int] = []
+        # Zobrist hash of the board, and of the content of each row, see rehash()
+        self.rowhash : List[int] = []
+        self.zobrist = 0
+        # rows changed since the last take_dirty(), e.g., for the GUI to repaint only those
+        self.dirty : Set[int] = set()
+        _extend_keys(width, height)
+        self.clear()
+
+    def __setitem__(self, key: Tuple[int, int], value: Tetrominoes) -> None:
+        """Setter to allow board[x,y] = shape syntax"""
+        col, row = key # board[x,y] -> key will be a tuple
+        index = row*self.nTilesH + col
+        old = self.tiles[index]
+        delta = (value != Tetrominoes.NoShape) - (old != Tetrominoes.NoShape)
+        self.tiles[index] = value
+        if old != value:
+            self.rehash(col, row, old, value)
+            self.dirty.add(row)
+        if delta:
+            self.rowfill[row] += delta
+            if self.rowfill[row] == self.nTilesH:
+                self.fullrows.add(row)
+            else:
+                self.fullrows.discard(row)
+            if delta > 0:
+                if row >= self.heights[col]:
+                    self.heights[col] = row + 1
+            elif row + 1 == self.heights[col]:
+                self.heights[col] = self.column_height(col, row)
+
+    def __getitem__(self, key: Tuple[int, int]) -> Tetrominoes:
+        """Setter to allow board[x,y] syntax"""
+        col, row = key # board[x,y] -> key will be a tuple
+        return self.tiles[row*self.nTilesH + col]
+
+    def clear(self) -> None:
+        """Fill the board with "no shape" pieces"""
+        self.dirty.update(range(max(self.heights, default=0))) # the rows of the stack
+        self.tiles[:] = [Tetrominoes.NoShape] * (self.nTilesV * self.nTilesH)
+        self.rowfill[:] = [0] * self.nTilesV
+        self.fullrows.clear()
+        self.heights[:] = [0] * self.nTilesH
+        self.clear_hash()
+
+    def clear_hash(self) -> None:
+        """Set the Zobrist hash to that of an empty board"""
+        self.rowhash[:] = [0] * self.nTilesV
+        self.zobrist = 0
+        for y in range(self.nTilesV):
+            self.zobrist ^= _mix(0, y)
+
+    def rehash(self, col: int, row: int, old: int, new: int) -> None:
+        """Update the Zobrist hash for the tile at (col, row) changed from shape old to new.
+
+        The hash of a row is the XOR of the keys of the shape at each column, and the hash of the
+        board, self.zobrist, is the XOR of the row hashes mixed with the row index. Changing a
+        tile takes two mixes, and moving rows only needs to mix the row hashes again at their new
+        index, without looking at the tiles.
+        """
+        rowhash = self.rowhash[row]
+        self.zobrist ^= _mix(rowhash, row)
+        rowhash ^= TILE_KEYS[col*8 + old] ^ TILE_KEYS[col*8 + new]
+        self.rowhash[row] = rowhash
+        self.zobrist ^= _mix(rowhash, row)
+
+    def shift_hash(self, full: List[int]) -> None:
+        """Update the Zobrist hash for removing the full rows, given from top to bottom, and
+        adding as many empty rows at top. Only the rows from the lowest full row up move"""
+        rowhash, zobrist, bottom = self.rowhash, self.zobrist, full[-1]
+        for y in range(bottom, self.nTilesV):
+            zobrist ^= _mix(rowhash[y], y)
+        for y in full:
+            del rowhash[y]
+        rowhash.extend([0] * len(full))
+        for y in range(bottom, self.nTilesV):
+            zobrist ^= _mix(rowhash[y], y)
+        self.zobrist = zobrist
+
+    def take_dirty(self) -> List[int]:
+        """The rows changed since the last call, from bottom to top, e.g., for the GUI to repaint
+        only those. A tile written marks its row, and removing or putting back full rows marks the
+        rows of the stack from the lowest of them up, as those have moved"""
+        rows = sorted(self.dirty)
+        self.dirty.clear()
+        return rows
+
+    def bitmasks(self, top: Optional[int] = None) -> List[int]:
+        """The rows from bottom to top as integer bitmasks, which bit i is set if column i is
+        occupied, or only the rows below top. The list must not be modified"""
+        width, tiles = self.nTilesH, self.tiles
+        return [sum(1 << i for i in range(width) if tiles[y*width + i] != Tetrominoes.NoShape)
+                for y in range(self.nTilesV if top is None else top)]
+
+    def column_height(self, col: int, top: int) -> int:
+        """Find the height of a column counting only the rows below top, by scanning down from it.
+        Used to update self.heights when the highest tile of a column is removed"""
+        width, tiles = self.nTilesH, self.tiles
+        for y in range(top - 1, -1, -1):
+            if tiles[y*width + col] != Tetrominoes.NoShape:
+                return y + 1
+        return 0
+
+    def landing_row(self, piece: Shape, x: int) -> int:
+        """Tell the row y at which the piece at column x comes to rest if dropped from above the
+        stack, i.e., the lowest position that each tile is above the highest occupied tile of its
+        column. It takes one lookup of the height map per column of the piece, without checking
+        the positions on the way down. The piece is assumed to be within the board horizontally.
+        """
+        heights = self.heights
+        return max(heights[x+px] - py for px, py in piece.bottom)
+
+    def check_pos(self, piece: Shape, x: int, y: int) -> bool:
+        """Check the validity of placing the a piece at position (x,y)
+
+        Returns:
+            boolean for whether it is valid to place the piece at (x,y)
+        """
+        debug = logger.isEnabledFor(logging.DEBUG) # skip all logging calls if not needed
+        if debug:
+            logger.debug("check_pos %s shape on (%d, %d)", piece.shape, x, y)
+        coords = [[px+x, py+y] for px, py in piece.coords if py+y < self.nTilesV]
+        if not coords:
+            if debug:
+                logger.debug("fail for fully above the board: %s -> %s", piece.coords, coords)
+            return False
+        if not all(0 <= cx < self.nTilesH and cy >= 0 for cx, cy in coords):
+            if debug:
+                logger.debug("fail for crossing board boundary: %s -> %s", piece.coords, coords)
+            return False
+        if any(self[cx, cy] != Tetrominoes.NoShape for cx, cy in coords):
+            if debug:
+                logger.debug("fail for collision")
+            return False
+        return True # all other cases is OK
+
+    def fix_pos(self, piece: Shape, x: int, y: int) -> None:
+        """Fix a piece at position (x, y), assumed corresponding check_pos() returns
+        True. Any tile above the top boundary is ignored. The board is updated after this function
+        called.
+        """
+        coords = [[px+x, py+y] for px, py in piece.coords if py+y < self.nTilesV]
+        for cx, cy in coords:
+            self[cx, cy] = piece.shape
+
+    def removefull(self) -> int:
+        """Remove any full rows in the board. Move rows down and refill the top rows with
+        NoShape. This board will be updated after this function call if any full rows are removed
+
+        Returns:
+            The number of rows removed
+        """
+        if not self.fullrows:
+            return 0
+        # Remove full rows from top to bottom, such that the row index below is not affected
+        full = sorted(self.fullrows, reverse=True)
+        logger.debug("full rows: %s", full)
+        width = self.nTilesH
+        self.shift_hash(full)
+        for y in full:
+            del self.tiles[y*width:(y+1)*width]
+            del self.rowfill[y]
+        # Fill in new rows at top with NoShape
+        self.tiles.extend([Tetrominoes.NoShape] * (len(full) * width))
+        self.rowfill.extend([0] * len(full))
+        self.fullrows.clear()
+        self.dirty.update(range(full[-1], max(self.heights)))
+        self.update_heights(len(full))
+        return len(full)
+
+    def update_heights(self, removed: int) -> None:
+        """Update the height map after removing a number of full rows. Every column is occupied
+        on the full rows, hence each column drops by that many rows and then down to its highest
+        remaining tile"""
+        heights = self.heights
+        for col in range(self.nTilesH):
+            heights[col] = self.column_height(col, heights[col] - removed)
+
+class SparseBoardState(NamedTuple):
+    """State of a TetrisSparseBoard captured by snapshot(), with a copy of the occupied rows"""
+    tilerows: Dict[int, bytes]
+    rowfill: Dict[int, int]
+    fullrows: FrozenSet[int]
+    heights: Tuple[int, ...]
+    rowhash: Dict[int, int]
+    zobrist: int
+
+class TetrisSparseBoard(TetrisBoard):
+    """Same interface as TetrisBoard but only the rows with any occupied tile are held, as the
+    shapes of the row in a bytearray keyed by the row index, together with the number of occupied
+    tiles of each of them. Memory, clear() and removefull() then cost by the rows occupied, not
+    by the board area, e.g., for stress tests on very large boards that are mostly empty.
+
+    Rows without a tile, and their hash, are not held, hence the Zobrist hash of the board is that
+    of an empty board with the difference of each occupied row XORed in. It is the same hash as of
+    the other backends.
+    """
+    def __init__(self, width: int = 10, height: int = 18):
+        """Set the tiles dimension in the game board. Gameboy Tetris is 10x18"""
+        self.nTilesH = width  # i.e., row size in num of square tiles
+        self.nTilesV = height # i.e., col size in num of square tiles
+        # the occupied rows by index, and the number of occupied tiles of each of them
+        self.tilerows : Dict[int, bytearray] = {}
+        self.rowfill : Dict[int, int] = {}
+        self.fullrows : Set[int] = set()
+        self.heights : List[int] = []
+        self.rowhash : Dict[int, int] = {}
+        self.zobrist = 0
+        # rows changed since the last take_dirty(), e.g., for the GUI to repaint only those
+        self.dirty : Set[int] = set()
+        _extend_keys(width, height)
+        self.clear()
+
+    def __setitem__(self, key: Tuple[int, int], value: Tetrominoes) -> None:
+        """Setter to allow board[x,y] = shape syntax"""
+        col, row = key
+        line = self.tilerows.get(row)
+        old = line[col] if line is not None else Tetrominoes.NoShape
+        if old == value:
+            return
+        if line is None:
+            line = self.tilerows[row] = bytearray(self.nTilesH)
+            self.rowfill[row] = 0
+        self.rehash(col, row, old, value)
+        self.dirty.add(row)
+        line[col] = value
+        if old == Tetrominoes.NoShape:
+            self.rowfill[row] += 1
+            if self.rowfill[row] == self.nTilesH:
+                self.fullrows.add(row)
+            if row >= self.heights[col]:
+                self.heights[col] = row + 1
+        elif value == Tetrominoes.NoShape:
+            self.rowfill[row] -= 1
+            self.fullrows.discard(row)
+            if not self.rowfill[row]:
+                del self.tilerows[row], self.rowfill[row]
+            if row + 1 == self.heights[col]:
+                self.heights[col] = self.column_height(col, row)
+
+    def __getitem__(self, key: Tuple[int, int]) -> Tetrominoes:
+        """Setter to allow board[x,y] syntax"""
+        col, row = key
+        line = self.tilerows.get(row)
+        return Tetrominoes(line[col]) if line is not None else Tetrominoes.NoShape
+
+    def clear(self) -> None:
+        """Drop all rows, as all of them are empty"""
+        self.dirty.update(range(max(self.heights, default=0)))
+        self.tilerows.clear()
+        self.rowfill.clear()
+        self.fullrows.clear()
+        self.heights[:] = [0] * self.nTilesH
+        self.clear_hash()
+
+    def clear_hash(self) -> None:
+        """Set the Zobrist hash to that of an empty board"""
+        self.rowhash.clear()
+        self.zobrist = _empty_hash(self.nTilesV)
+
+    def rehash(self, col: int, row: int, old: int, new: int) -> None:
+        """Update the Zobrist hash for the tile at (col, row) changed from shape old to new, same
+        as TetrisBoard.rehash() but with the hash of an empty row as 0 without holding it"""
+        rowhash = self.rowhash.get(row, 0)
+        self.zobrist ^= _mix(rowhash, row)
+        rowhash ^= TILE_KEYS[col*8 + old] ^ TILE_KEYS[col*8 + new]
+        if rowhash:
+            self.rowhash[row] = rowhash
+        else:
+            self.rowhash.pop(row, None)
+        self.zobrist ^= _mix(rowhash, row)
+
+    def bitmasks(self, top: Optional[int] = None) -> List[int]:
+        """The rows from bottom to top as integer bitmasks, which bit i is set if column i is
+        occupied, or only the rows below top, e.g., the stack. The list must not be modified"""
+        rows = [0] * (self.nTilesV if top is None else top)
+        for y, line in self.tilerows.items():
+            if y < len(rows):
+                rows[y] = self.row_state(y)[0]
+        return rows
+
+    def row_state(self, row: int) -> Tuple[int, bytearray]:
+        """The bitmask and the shapes of a row, e.g., of a full row to put back with
+        insertrows()"""
+        line = self.tilerows.get(row)
+        if line is None:
+            return 0, bytearray(self.nTilesH)
+        return int(line.translate(_BITCHARS)[::-1], 2), line # column 0 is the last digit
+
+    def column_height(self, col: int, top: int) -> int:
+        """Find the height of a column counting only the rows below top, by scanning down from it.
+        Used to update self.heights when the highest tile of a column is removed"""
+        tilerows = self.tilerows
+        for y in range(top - 1, -1, -1):
+            line = tilerows.get(y)
+            if line is not None and line[col]:
+                return y + 1
+        return 0
+
+    def check_pos(self, piece: Shape, x: int, y: int) -> bool:
+        """Check the validity of placing the a piece at position (x,y)
+
+        Returns:
+            boolean for whether it is valid to place the piece at (x,y)
+        """
+        debug = logger.isEnabledFor(logging.DEBUG) # skip all logging calls if not needed
+        if debug:
+            logger.debug("check_pos %s shape on (%d, %d)", piece.shape, x, y)
+        tilerows = self.tilerows
+        inside = False
+        for px, py in piece.coords:
+            cx, cy = px+x, py+y
+            if cy >= self.nTilesV:
+                continue # tile above the board is not checked
+            if not 0 <= cx < self.nTilesH or cy < 0:
+                if debug:
+                    logger.debug("fail for crossing board boundary: %s at (%d, %d)",
+                                 piece.coords, x, y)
+                return False
+            line = tilerows.get(cy)
+            if line is not None and line[cx]:
+                if debug:
+                    logger.debug("fail for collision")
+                return False
+            inside = True
+        if not inside:
+            if debug:
+                logger.debug("fail for fully above the board: %s at (%d, %d)", piece.coords, x, y)
+        return inside
+
+    def removefull(self) -> int:
+        """Remove any full rows in the board. The occupied rows above them move down, by as many
+        full rows as there are below each, and the hash is updated for only those rows
+
+        Returns:
+            The number of rows removed
+        """
+        if not self.fullrows:
+            return 0
+        full = sorted(self.fullrows)
+        logger.debug("full rows: %s", full)
+        tilerows, rowfill, rowhash = self.tilerows, self.rowfill, self.rowhash
+        moved = sorted(y for y in tilerows if y > full[0] and y not in self.fullrows)
+        zobrist = self.zobrist
+        for y in full + moved: # take out the rows from their position
+            zobrist ^= _mix(rowhash.get(y, 0), y) ^ _mix(0, y)
+        for y in full:
+            del tilerows[y], rowfill[y]
+            rowhash.pop(y, None)
+        for y in moved: # from bottom up, such that the row moved to is already vacated
+            new = y - bisect_left(full, y)
+            tilerows[new] = tilerows.pop(y)
+            rowfill[new] = rowfill.pop(y)
+            if y in rowhash:
+                rowhash[new] = rowhash.pop(y)
+            zobrist ^= _mix(rowhash.get(new, 0), new) ^ _mix(0, new)
+        self.zobrist = zobrist
+        self.fullrows.clear()
+        self.dirty.update(range(full[0], max(self.heights)))
+        self.update_heights(len(full))
+        return len(full)
+
+    def insertrows(self, removed: Sequence[Tuple[int, int, bytearray]]) -> None:
+        """Put back the full rows removed by removefull(), same as TetrisBitBoard.insertrows()
+        but only the occupied rows above them move up"""
+        if not removed:
+            return
+        full = [y for y, _, _ in removed]
+        tilerows, rowfill, rowhash = self.tilerows, self.rowfill, self.rowhash
+        zobrist = self.zobrist
+        for y in sorted((y for y in tilerows if y >= full[0]), reverse=True):
+            new = y # from top down, such that the row moved to is already vacated
+            for f in full:
+                if f <= new:
+                    new += 1
+            zobrist ^= _mix(rowhash.get(y, 0), y) ^ _mix(0, y)
+            tilerows[new] = tilerows.pop(y)
+            rowfill[new] = rowfill.pop(y)
+            if y in rowhash:
+                rowhash[new] = rowhash.pop(y)
+            zobrist ^= _mix(rowhash.get(new, 0), new) ^ _mix(0, new)
+        for y, _, colors in removed:
+            hashed = 0
+            for col, shape in enumerate(colors):
+                hashed ^= TILE_KEYS[col*8 + shape]
+            tilerows[y] = bytearray(colors)
+            rowfill[y] = self.nTilesH
+            rowhash[y] = hashed
+            zobrist ^= _mix(hashed, y) ^ _mix(0, y)
+            self.fullrows.add(y)
+        self.zobrist = zobrist
+        # every column is occupied on the rows put back, see TetrisBitBoard.insertrows()
+        heights, top = self.heights, full[-1] + 1
+        for col in range(self.nTilesH):
+            heights[col] = self.column_height(col, min(self.nTilesV,
+                                                       max(heights[col] + len(full), top)))
+        self.dirty.update(range(full[0], max(heights)))
+
+    def snapshot(self) -> SparseBoardState:
+        """Capture the state of the board, to restore() it later or on another board of the same
+        size. It copies the occupied rows only"""
+        return SparseBoardState({y: bytes(line) for y, line in self.tilerows.items()},
+                                dict(self.rowfill), frozenset(self.fullrows), tuple(self.heights),
+                                dict(self.rowhash), self.zobrist)
+
+    def restore(self, state: SparseBoardState) -> None:
+        """Bring the board to a state from snapshot(), which can be restored again afterwards"""
+        # the rows of the stack before and after may differ, a fork marks them in a set of its own
+        self.dirty = self.dirty.union(range(max(self.heights + list(state.heights))))
+        self.tilerows = {y: bytearray(line) for y, line in state.tilerows.items()}
+        self.rowfill = dict(state.rowfill)
+        self.fullrows = set(state.fullrows)
+        self.heights = list(state.heights)
+        self.rowhash = dict(state.rowhash)
+        self.zobrist = state.zobrist
+
+class BoardState(NamedTuple):
+    """State of a TetrisBitBoard captured by snapshot(). The rows of the color plane are shared
+    with the board, which copies a row before it writes to it"""
+    rows: Tuple[int, ...]
+    colorrows: Tuple[bytearray, ...]
+    fullrows: FrozenSet[int]
+    heights: Tuple[int, ...]
+    rowhash: Tuple[int, ...]
+    zobrist: int
+
+class TetrisBitBoard(TetrisBoard):
+    """Same interface as TetrisBoard but each row is held as an integer bitmask, which bit i is set
+    if column i is occupied. The shape of each tile, which only matters for drawing, is held in a
+    separate color plane of one bytearray per row. Collision check is then some bit shifts and
+    ANDs. The bitmask is also the fill count of a row, as a full row is just a mask of all ones.
+
+    A snapshot or fork of the board shares the rows of the color plane with it, and costs only a
+    copy of the lists of rows. Each row is then copied on its first write afterwards, on the board
+    or on the fork, as told by self.owned.
+    """
+    def __init__(self, width: int = 10, height: int = 18):
+        """Set the tiles dimension in the game board. Gameboy Tetris is 10x18"""
+        self.nTilesH = width  # i.e., row size in num of square tiles
+        self.nTilesV = height # i.e., col size in num of square tiles
+        self.fullrow = (1 << width) - 1 # bitmask of a row with all tiles occupied
+        # one bitmask per row, from bottom to top, the color plane of each row, and whether it is
+        # owned by this board, i.e., not shared with any snapshot and can be written in place
+        self.rows : List[int] = []
+        self.colorrows : List[bytearray] = []
+        self.owned : List[bool] = []
+        self.fullrows : Set[int] = set()
+        self.heights : List[int] = []
+        self.rowhash : List[int] = []
+        self.zobrist = 0
+        # rows changed since the last take_dirty(), e.g., for the GUI to repaint only those
+        self.dirty : Set[int] = set()
+        _extend_keys(width, height)
+        self.clear()
+
+    def __setitem__(self, key: Tuple[int, int], value: Tetrominoes) -> None:
+        """Setter to allow board[x,y] = shape syntax"""
+        col, row = key
+        old = self.colorrows[row][col]
+        if old != value:
+            self.rehash(col, row, old, value)
+            self.writable_row(row)[col] = value
+            self.dirty.add(row)
+        if value == Tetrominoes.NoShape:
+            self.rows[row] &= ~(1 << col)
+            self.fullrows.discard(row)
+            if row + 1 == self.heights[col]:
+                self.heights[col] = self.column_height(col, row)
+        else:
+            self.rows[row] |= 1 << col
+            if self.rows[row] == self.fullrow:
+                self.fullrows.add(row)
+            if row >= self.heights[col]:
+                self.heights[col] = row + 1
+
+    def __getitem__(self, key: Tuple[int, int]) -> Tetrominoes:
+        """Setter to allow board[x,y] syntax"""
+        col, row = key
+        return Tetrominoes(self.colorrows[row][col])
+
+    @property
+    def colors(self) -> bytes:
+        """The color plane in row major order, e.g., for the GUI to compare with what it drew"""
+        return b"".join(self.colorrows)
+
+    def clear(self) -> None:
+        """Empty all rows and fill the color plane with "no shape" """
+        self.dirty.update(range(max(self.heights, default=0)))
+        self.rows[:] = [0] * self.nTilesV
+        self.colorrows[:] = [bytearray(self.nTilesH) for _ in range(self.nTilesV)]
+        self.owned[:] = [True] * self.nTilesV
+        self.fullrows.clear()
+        self.heights[:] = [0] * self.nTilesH
+        self.clear_hash()
+
+    def writable_row(self, row: int) -> bytearray:
+        """The color plane of a row to write in place, copied first if it is shared"""
+        if not self.owned[row]:
+            self.colorrows[row] = bytearray(self.colorrows[row])
+            self.owned[row] = True
+        return self.colorrows[row]
+
+    def snapshot(self) -> BoardState:
+        """Capture the state of the board, to restore() it later or on another board of the same
+        size. It takes a copy of the lists of rows but not of the rows, which become shared"""
+        self.owned[:] = [False] * self.nTilesV
+        return BoardState(tuple(self.rows), tuple(self.colorrows), frozenset(self.fullrows),
+                          tuple(self.heights), tuple(self.rowhash), self.zobrist)
+
+    def restore(self, state: BoardState) -> None:
+        """Bring the board to a state from snapshot(), which can be restored again afterwards"""
+        # the rows of the stack before and after may differ, a fork marks them in a set of its own
+        self.dirty = self.dirty.union(range(max(self.heights + list(state.heights))))
+        self.rows = list(state.rows)
+        self.colorrows = list(state.colorrows)
+        self.owned = [False] * self.nTilesV
+        self.fullrows = set(state.fullrows)
+        self.heights = list(state.heights)
+        self.rowhash = list(state.rowhash)
+        self.zobrist = state.zobrist
+
+    def bitmasks(self, top: Optional[int] = None) -> List[int]:
+        """The rows from bottom to top as integer bitmasks, which is self.rows itself, or only the
+        rows below top. The list must not be modified"""
+        return self.rows if top is None else self.rows[:top]
+
+    def row_state(self, row: int) -> Tuple[int, bytearray]:
+        """The bitmask and the color plane of a row, e.g., of a full row to put back with
+        insertrows()"""
+        return self.rows[row], self.colorrows[row]
+
+    def column_height(self, col: int, top: int) -> int:
+        """Find the height of a column counting only the rows below top, by scanning down from it.
+        Used to update self.heights when the highest tile of a column is removed"""
+        rows = self.rows
+        for y in range(top - 1, -1, -1):
+            if rows[y] >> col & 1:
+                return y + 1
+        return 0
+
+    def check_pos(self, piece: Shape, x: int, y: int) -> bool:
+        """Check the validity of placing the a piece at position (x,y)
+
+        Returns:
+            boolean for whether it is valid to place the piece at (x,y)
+        """
+        debug = logger.isEnabledFor(logging.DEBUG) # skip all logging calls if not needed
+        if debug:
+            logger.debug("check_pos %s shape on (%d, %d)", piece.shape, x, y)
+        inside = False
+        for px, py in piece.coords:
+            cx, cy = px+x, py+y
+            if cy >= self.nTilesV:
+                continue # tile above the board is not checked
+            if not 0 <= cx < self.nTilesH or cy < 0:
+                if debug:
+                    logger.debug("fail for crossing board boundary: %s at (%d, %d)", piece.coords, x, y)
+                return False
+            if self.rows[cy] >> cx & 1:
+                if debug:
+                    logger.debug("fail for collision")
+                return False
+            inside = True
+        if not inside:
+            if debug:
+                logger.debug("fail for fully above the board: %s at (%d, %d)", piece.coords, x, y)
+        return inside
+
+    def fix_pos(self, piece: Shape, x: int, y: int) -> None:
+        """Fix a piece at position (x, y), assumed corresponding check_pos() returns
+        True. Any tile above the top boundary is ignored. The board is updated after this function
+        called.
+        """
+        for px, py in piece.coords:
+            cx, cy = px+x, py+y
+            if cy >= self.nTilesV:
+                continue
+            old = self.colorrows[cy][cx]
+            if old != piece.shape:
+                self.rehash(cx, cy, old, piece.shape)
+                self.writable_row(cy)[cx] = piece.shape
+                self.dirty.add(cy)
+            self.rows[cy] |= 1 << cx
+            if self.rows[cy] == self.fullrow:
+                self.fullrows.add(cy)
+            if cy >= self.heights[cx]:
+                self.heights[cx] = cy + 1
+
+    def removefull(self) -> int:
+        """Remove any full rows in the board. Move rows down and refill the top rows with
+        NoShape. This board will be updated after this function call if any full rows are removed
+
+        Returns:
+            The number of rows removed
+        """
+        if not self.fullrows:
+            return 0
+        # Remove full rows from top to bottom, such that the row index below is not affected
+        full = sorted(self.fullrows, reverse=True)
+        logger.debug("full rows: %s", full)
+        self.shift_hash(full)
+        for y in full:
+            del self.rows[y]
+            del self.colorrows[y]
+            del self.owned[y]
+        # Fill in new rows at top with NoShape
+        self.rows.extend([0] * len(full))
+        self.colorrows.extend(bytearray(self.nTilesH) for _ in full)
+        self.owned.extend([True] * len(full))
+        self.fullrows.clear()
+        self.dirty.update(range(full[-1], max(self.heights)))
+        self.update_heights(len(full))
+        return len(full)
+
+    def insertrows(self, removed: Sequence[Tuple[int, int, bytearray]]) -> None:
+        """Put back the full rows removed by removefull(), e.g., to undo a piece dropped, given as
+        (index, bitmask, color plane) from bottom to top with the index before the removal. The
+        rows above move up and as many empty rows at the top are dropped. The color planes become
+        shared with the caller and are copied on write"""
+        if not removed:
+            return
+        n, height, bottom = len(removed), self.nTilesV, removed[0][0]
+        rowhash, zobrist = self.rowhash, self.zobrist
+        for y in range(bottom, height):
+            zobrist ^= _mix(rowhash[y], y)
+        for rows in (self.rows, self.colorrows, self.owned, rowhash):
+            del rows[height-n:]
+        for y, mask, colors in removed: # from bottom up, such that the index above is unaffected
+            self.rows.insert(y, mask)
+            self.colorrows.insert(y, colors)
+            self.owned.insert(y, False)
+            hashed = 0
+            for col, shape in enumerate(colors):
+                hashed ^= TILE_KEYS[col*8 + shape]
+            rowhash.insert(y, hashed)
+            self.fullrows.add(y)
+        for y in range(bottom, height):
+            zobrist ^= _mix(rowhash[y], y)
+        self.zobrist = zobrist
+        # every column is occupied on the rows put back, which may be above its stack, e.g., a
+        # row cleared over an overhang, hence scan down from the higher of the two
+        heights, top = self.heights, removed[-1][0] + 1
+        for col in range(self.nTilesH):
+            heights[col] = self.column_height(col, min(height, max(heights[col] + n, top)))
+        self.dirty.update(range(bottom, max(heights)))
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
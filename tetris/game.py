@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Tetris game logic, independent of the GUI library
+"""
+from __future__ import annotations
+
+from typing import Callable, Deque, Dict, Iterable, NamedTuple, Optional, Tuple, Type, Union
+from collections import deque
+import copy
+import logging
+
+from .shape import Tetrominoes, Shape
+from .board import BoardState, SparseBoardState, TetrisBitBoard, TetrisSparseBoard
+from .randomizer import Randomizer, UniformRandomizer
+
+logger = logging.getLogger(__name__)
+
+# The inputs a policy can produce, same as what a player can do with the keyboard
+MOVES = ("left", "right", "cw", "ccw", "down", "drop")
+
+class DropDelta(NamedTuple):
+    """What piece_dropped() changed in a game, to undo it: the current piece before it, the tiles
+    it fixed, and the rows that removefull() removed"""
+    this_piece: Shape
+    next_piece: Shape
+    cur_x: int
+    cur_y: int
+    cells: Tuple[Tuple[int, int], ...]               # (x, y) of the tiles written
+    removed: Tuple[Tuple[int, int, bytearray], ...]  # (y, bitmask, color plane), bottom first
+
+class GameState(NamedTuple):
+    """State of a TetrisGame captured by snapshot()"""
+    board: Union[BoardState, SparseBoardState]
+    this_piece: Shape
+    next_piece: Shape
+    cur_x: int
+    cur_y: int
+    neednewpiece: bool
+    paused: bool
+    started: bool
+    rows_completed: int
+    pieces: int
+    score: int
+    level: int
+    randomizer: Randomizer # a copy, such that the pieces drawn after restore() are the same
+    undo_stack: Tuple[DropDelta, ...]
+    redo_stack: Tuple[DropDelta, ...]
+
+class GameLogic:
+    """Tetris game with logic. Implement all interface-independent logic here. It is mixed into a
+    board backend, which must also provide snapshot(), restore(), row_state() and insertrows(),
+    see TetrisGame and TetrisSparseGame"""
+    def __init__(self, *args, randomizer: Optional[Randomizer] = None, undo: Optional[int] = 0,
+                 **kwargs):
+        """Create a game board. The pieces are drawn from the randomizer, or a UniformRandomizer
+        with random seed if not provided. Undo is the number of pieces dropped that can be undone,
+        None for no limit, or 0 to not record them at all"""
+        super().__init__(*args, **kwargs)
+        self.randomizer = randomizer or UniformRandomizer()
+        # Changes of the last pieces dropped to undo(), and of the pieces undone to redo()
+        self.undo_stack : Deque[DropDelta] = deque(maxlen=undo)
+        self.redo_stack : Deque[DropDelta] = deque(maxlen=undo)
+        # This and next piece of tetrominoes, and the position of the current piece
+        self.this_piece = Shape.table[Tetrominoes.NoShape][0]
+        self.next_piece = Shape.table[Tetrominoes.NoShape][0]
+        self.cur_x = 0
+        self.cur_y = 0
+        # State variable of the game
+        self.neednewpiece = False   # Old piece dropped, new piece to be created
+        self.paused = False         # Game paused, timer should be suspended
+        self.started = False        # Game started, timer should be created
+        self.rows_completed = 0     # Game state: number of rows completed
+        self.pieces = 0             # Game state: number of pieces entered the board
+        self.score = 0              # Track score
+        self.level = 0              # Track level
+
+    def snapshot(self) -> GameState:
+        """Capture the state of the game, including the pieces that can be undone and redone, to
+        restore() it later, e.g., to seek in a replay or to undo a search. The rows of the board
+        are shared on TetrisBitBoard"""
+        return GameState(super().snapshot(), self.this_piece, self.next_piece, self.cur_x,
+                         self.cur_y, self.neednewpiece, self.paused, self.started,
+                         self.rows_completed, self.pieces, self.score, self.level,
+                         copy.deepcopy(self.randomizer), tuple(self.undo_stack),
+                         tuple(self.redo_stack))
+
+    def restore(self, state: GameState) -> None:
+        """Bring the game to a state from snapshot(), which can be restored again afterwards"""
+        super().restore(state.board)
+        self.this_piece, self.next_piece = state.this_piece, state.next_piece
+        self.cur_x, self.cur_y = state.cur_x, state.cur_y
+        self.neednewpiece, self.paused, self.started = (state.neednewpiece, state.paused,
+                                                        state.started)
+        self.rows_completed, self.pieces = state.rows_completed, state.pieces
+        self.score, self.level = state.score, state.level
+        self.randomizer = copy.deepcopy(state.randomizer)
+        self.undo_stack = deque(state.undo_stack, maxlen=self.undo_stack.maxlen)
+        self.redo_stack = deque(state.redo_stack, maxlen=self.redo_stack.maxlen)
+
+    def fork(self) -> GameLogic:
+        """Make a new game in the same state, which then plays independently of this one and
+        draws the same pieces. On TetrisBitBoard, the rows are shared until either game writes
+        them. Methods overridden on this game object, e.g., the hooks of a ReplayRecorder, are
+        bound to this game and not carried over, hence a fork of a recorded game is not recorded"""
+        child = copy.copy(self) # then replace the mutable attributes it shares with this game
+        for name in [name for name in vars(child) if callable(getattr(type(child), name, None))]:
+            del child.__dict__[name]
+        super(GameLogic, child).restore(super().snapshot())
+        child.randomizer = copy.deepcopy(self.randomizer)
+        child.undo_stack = self.undo_stack.copy()
+        child.redo_stack = self.redo_stack.copy()
+        return child
+
+    def start(self) -> bool:
+        """Trigger start of the game. Initialize everything.
+
+        Returns:
+            Boolean to indicate the game started successfully. It failed to start only if the game
+            has been paused.
+        """
+        if self.paused:
+            return False
+        self.started = True
+        self.neednewpiece = False
+        self.rows_completed = 0
+        self.pieces = 0
+        self.score = 0
+        self.level = 1
+        self.undo_stack.clear()
+        self.redo_stack.clear()
+        self.next_piece = self.new_piece()
+        self.make_new_piece()
+        self.clear()
+        return True
+
+    def new_piece(self) -> Shape:
+        """Draw the next piece from the randomizer"""
+        return Shape.table[self.randomizer.next()][0]
+
+    def make_new_piece(self) -> bool:
+        """Generate a new piece of tetromino. If we cannot place it in the default position, the
+        game is finished.
+
+        Returns:
+            Boolean to indicate we can still generate a new piece and place it on the board
+        """
+        # generate new piece and position at top middle, then check if we can still proceed
+        self.neednewpiece = False
+        if self.try_pos(self.next_piece, self.nTilesH // 2, self.nTilesV - 1):
+            self.next_piece = self.new_piece() # next_piece became this_piece, replace it with a new one
+            self.pieces += 1
+            return True
+        # cannot even place the shape at top middle of the board, finish the game
+        self.this_piece = Shape.table[Tetrominoes.NoShape][0]
+        self.started = False
+        return False
+
+    def pause(self) -> bool:
+        """Toggle pause state
+
+        Returns:
+            Whether the game is paused. If the game is not started, always True
+        """
+        if not self.started:
+            return True
+        self.paused = not self.paused
+        return self.paused
+
+    def try_pos(self, piece: Shape, x: int, y: int) -> bool:
+        """Attempt to place a piece onto the game board such that its origin is at position (x, y).
+        The piece is not registered on the board but will check against the board for collision. If
+        the position is valid, such positions are remembered as self.cur_x and self.cur_y and the
+        piece is replacing self.this_piece
+
+        Returns:
+            Boolean to indicate whether this piece and position is valid
+        """
+        if self.check_pos(piece, x, y):
+            # this position is good, remember it
+            self.this_piece = piece
+            self.cur_x = x
+            self.cur_y = y
+            return True
+        return False # the piece cannot be placed at this position
+
+    def piece_dropped(self) -> None:
+        """Call this only if try_pos() failed on the lowest position self.cur_y-1. This merge in
+        self.this_piece into the board, remove all existing full rows, and move down all the rows
+        above them. It also hint for generating a new piece in the next step.  This is the only
+        place the flag self.neednewpiece is asserted.
+        """
+        # fix this_piece into the board (ignore any tile above top boundary)
+        piece, x, y = self.this_piece, self.cur_x, self.cur_y
+        self.fix_pos(piece, x, y)
+        if self.undo_stack.maxlen != 0:
+            cells = tuple((px+x, py+y) for px, py in piece.coords if py+y < self.nTilesV)
+            removed = tuple((row,) + self.row_state(row) for row in sorted(self.fullrows))
+            self.undo_stack.append(DropDelta(piece, self.next_piece, x, y, cells, removed))
+            self.redo_stack.clear()
+        self.neednewpiece = True
+        self.this_piece = Shape.table[Tetrominoes.NoShape][0]
+        # find all rows that are full and remove them
+        rows_removed = self.removefull()
+        logger.debug("%d rows removed", rows_removed)
+        if rows_removed:
+            self.rows_completed += rows_removed
+
+    def undo(self) -> bool:
+        """Take back the last piece dropped: the rows it completed and its tiles are removed from
+        the board, and it is the current piece again at where it was dropped. If the next piece
+        has entered since, it is the next piece again and the piece drawn for it is put back to
+        the randomizer, such that the same pieces follow. A game over is undone too.
+
+        Returns:
+            Whether there was a piece to undo
+        """
+        if not self.undo_stack:
+            return False
+        move = self.undo_stack.pop()
+        if not self.neednewpiece and self.started:
+            self.randomizer.prepend(bytes((self.next_piece.shape,)))
+            self.pieces -= 1
+        self.insertrows(move.removed)
+        for cell in move.cells:
+            self[cell] = Tetrominoes.NoShape
+        self.rows_completed -= len(move.removed)
+        self.this_piece, self.next_piece = move.this_piece, move.next_piece
+        self.cur_x, self.cur_y = move.cur_x, move.cur_y
+        self.neednewpiece = False
+        self.started = True
+        self.redo_stack.append(move)
+        return True
+
+    def redo(self) -> bool:
+        """Drop again the last piece undone, at where it was dropped, unless another piece has
+        been dropped since. As after piece_dropped(), the game then needs a new piece.
+
+        Returns:
+            Whether there was a piece to redo
+        """
+        if not self.redo_stack:
+            return False
+        move = self.redo_stack.pop()
+        redo, self.redo_stack = self.redo_stack, deque(maxlen=0) # not cleared by piece_dropped()
+        if self.neednewpiece:
+            self.make_new_piece() # draw again the piece that undo() put back
+        self.this_piece, self.next_piece = move.this_piece, move.next_piece
+        self.cur_x, self.cur_y = move.cur_x, move.cur_y
+        self.piece_dropped()
+        self.redo_stack = redo
+        return True
+
+    def drop_row(self) -> int:
+        """Tell the row that the current piece would land on if dropped straight down from where
+        it is, e.g., for hard drop or showing a ghost piece. It is looked up from the height map
+        unless the piece has been moved below the top of the stack, e.g., tucked under an
+        overhang, or sticks out of the side above the board, which the piece has to step down
+        row by row
+        """
+        piece, x = self.this_piece, self.cur_x
+        min_x, max_x, _, _ = piece.extent
+        if 0 <= x + min_x and x + max_x < self.nTilesH:
+            y = self.landing_row(piece, x)
+            if y <= self.cur_y:
+                return y
+        y = self.cur_y
+        while self.check_pos(piece, x, y - 1):
+            y -= 1
+        return y
+
+    def hard_drop(self) -> None:
+        """Drop the current piece straight down and fix it on the board, same as calling
+        self.one_row_down() until it fails but without checking every row on the way
+        """
+        self.cur_y = self.drop_row()
+        self.piece_dropped()
+
+    def one_row_down(self) -> bool:
+        """Move self.this_piece one row down, i.e., to self.cur_y-1. If we cannot move down, call
+        self.piece_dropped() to update the game state
+
+        Returns:
+            Boolean to indicate if we can successfully move the current piece to one row down
+        """
+        if self.try_pos(self.this_piece, self.cur_x, self.cur_y - 1):
+            return True
+        self.piece_dropped()
+        return False
+
+class TetrisGame(GameLogic, TetrisBitBoard):
+    """Tetris game on a TetrisBitBoard, for the GUIs and the simulator"""
+
+class TetrisSparseGame(GameLogic, TetrisSparseBoard):
+    """Tetris game on a TetrisSparseBoard, e.g., for stress tests on very large boards that are
+    mostly empty"""
+
+# Game class on each board backend, by the name of the backend as in the benchmarks
+GAMES : Dict[str, Type[GameLogic]] = {
+    "bit": TetrisGame,
+    "sparse": TetrisSparseGame,
+}
+
+# A policy is called once for each new piece, with the game as argument, and returns the inputs to
+# apply to this piece, e.g., by the simulator or the demo mode of the GUI
+Policy = Callable[[TetrisGame], Iterable[str]]
+
+def apply_move(game: TetrisGame, move: str) -> None:
+    """Apply one input to the current piece of the game, as the GUI does on a key press"""
+    piece = game.this_piece
+    if move == "left":
+        game.try_pos(piece, game.cur_x - 1, game.cur_y)
+    elif move == "right":
+        game.try_pos(piece, game.cur_x + 1, game.cur_y)
+    elif move == "cw":
+        game.try_pos(piece.rotate_cw(), game.cur_x, game.cur_y)
+    elif move == "ccw":
+        game.try_pos(piece.rotate_ccw(), game.cur_x, game.cur_y)
+    elif move == "down":
+        game.one_row_down()
+    elif move == "drop":
+        game.hard_drop()
+    else:
+        raise ValueError("Unknown move %r" % move)
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""
+Real-time game loop, independent of the GUI library: the game logic advances on a fixed timestep
+by the wall clock, while the GUI paints at most once per display frame and only if something
+changed. A slow paint therefore delays the next frame but never slows down the game.
+"""
+from __future__ import annotations
+
+from typing import Callable, Iterator, Optional
+import logging
+import time
+
+from .game import Policy, TetrisGame, apply_move
+
+logger = logging.getLogger(__name__)
+
+TICKS_PER_SECOND = 60 # logic timestep
+FRAMES_PER_SECOND = 60 # display frames, i.e., how often the GUI should call GameLoop.frame()
+
+def gravity(level: int) -> int:
+    """Number of logic ticks for the piece to fall one row at a level: 18 ticks (300ms) at level
+    1, and 20% faster on each level up to one row per tick"""
+    return max(1, round(18 * 0.8 ** (max(level, 1) - 1)))
+
+class GameLoop:
+    """Drive a TetrisGame in real time. The GUI calls frame() on a timer at the display frame rate,
+    which runs as many logic ticks as the clock has advanced since the last frame, and tells if a
+    repaint is needed. Input handlers change the game directly and call invalidate() instead of
+    painting, such that all changes within one frame are painted together.
+
+    In demo mode, i.e., if self.player is set to a policy as in the simulator, the policy is asked
+    for the inputs of each new piece and they are applied one at a time every input_ticks ticks.
+    """
+    tick = 1 / TICKS_PER_SECOND
+    max_ticks = TICKS_PER_SECOND # catch up for at most one second, e.g., after the process slept
+    input_ticks = 6              # ticks between inputs in demo mode, i.e., 10 inputs per second
+
+    def __init__(self, game: TetrisGame, gravity: Callable[[int], int] = gravity,
+                 clock: Callable[[], float] = time.monotonic):
+        """Create the loop of a game. Gravity gives the number of ticks per row fall at a level,
+        and clock the current time in seconds"""
+        self.game = game
+        self.gravity = gravity
+        self.clock = clock
+        self.ticks = 0          # number of logic ticks run
+        self.player : Optional[Policy] = None # policy to play the game in demo mode
+        self.dirty = True       # something changed since the last paint
+        self._last = clock()    # time of the last frame
+        self._lag = 0.0         # time elapsed not yet consumed by logic ticks
+        self._fall = 0          # number of ticks since the piece last fell
+        self._moves : Iterator[str] = iter(()) # inputs of the current piece in demo mode
+        self._planned = -1      # the piece, by count of pieces in the game, that _moves is for
+
+    def reset(self) -> None:
+        """Restart the clock, e.g., when the game is started or resumed, such that the time
+        before does not count into the game"""
+        self._last = self.clock()
+        self._lag = 0.0
+        self._fall = 0
+        self._planned = -1
+        self.dirty = True
+
+    def invalidate(self) -> None:
+        """Mark the game changed, e.g., after handling an input, to paint on the next frame"""
+        self.dirty = True
+
+    def step(self) -> None:
+        """Run one logic tick. Once in a gravity period, the piece falls for one row, or a new
+        piece is produced if the last one has been dropped"""
+        self.ticks += 1
+        if self.player is not None and self.ticks % self.input_ticks == 0:
+            self.play()
+        self._fall += 1
+        if self._fall < self.gravity(self.game.level):
+            return
+        self._fall = 0
+        if self.game.neednewpiece:
+            self.game.make_new_piece()
+        else:
+            self.game.one_row_down()
+        self.dirty = True
+
+    def play(self) -> None:
+        """Apply the next input from self.player to the current piece, asking it for the inputs
+        if this is a new piece"""
+        game = self.game
+        if game.neednewpiece or not game.started:
+            return
+        if self._planned != game.pieces:
+            self._planned = game.pieces
+            self._moves = iter(self.player(game))
+        move = next(self._moves, None)
+        if move is not None:
+            apply_move(game, move)
+            self.dirty = True
+
+    def frame(self) -> bool:
+        """Advance the game to the current time in whole ticks, unless it is paused or over
+
+        Returns:
+            Whether the game changed since the last frame, i.e., the GUI should paint
+        """
+        now = self.clock()
+        game = self.game
+        if game.started and not game.paused:
+            self._lag += now - self._last
+            ticks = int(self._lag * TICKS_PER_SECOND)
+            if ticks > self.max_ticks:
+                logger.debug("%d ticks behind, skipped to %d", ticks, self.max_ticks)
+                ticks, self._lag = self.max_ticks, 0.0
+            else:
+                self._lag -= ticks * self.tick
+            for _ in range(ticks):
+                self.step()
+                if not game.started:
+                    break # game over
+        self._last = now
+        dirty, self.dirty = self.dirty, False
+        return dirty
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
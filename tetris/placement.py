@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Enumerate where a piece can be placed on a board, for bots and analysis. A placement is a final
+position of the piece reachable by dropping it straight down from above the stack, found from the
+height map of the board, together with the rows of the board after the piece is fixed there and
+the full rows removed. The board itself is never modified or copied as a whole.
+"""
+from __future__ import annotations
+
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .shape import Tetrominoes, Shape
+from .board import TetrisBoard, row_key
+
+class Placement(NamedTuple):
+    """A final position of a piece and the resulting board"""
+    piece: Shape       # the piece at its orientation, rotation tells how many times to rotate cw
+    x: int             # column of the piece's origin
+    y: int             # landing row of the piece's origin
+    rows: List[int]    # row bitmasks up to above the stack after the piece fixed and rows cleared
+    cleared: int       # number of full rows removed
+    heights: List[int] # height of each column of the resulting board
+    key: int           # 64-bit hash of the rows, see rows_key()
+
+class Orientation(NamedTuple):
+    """Precomputed geometry of a distinct orientation of a shape"""
+    piece: Shape                        # the first orientation in the rotation table of its kind
+    masks: Tuple[Tuple[int, int], ...]  # (y, bitmask) of the tiles on each row, bit 0 at min x
+
+def _orientations(shape: Tetrominoes) -> Tuple[Orientation, ...]:
+    """Find the distinct orientations of a shape from the rotation table. Two orientations are the
+    same if their tiles are the same up to translation, e.g., all of O, or I at rotation 0 and 2,
+    which always give the same set of placements"""
+    seen = set()
+    found = []
+    for piece in Shape.table[shape]:
+        min_x, _, min_y, _ = piece.extent
+        cells = frozenset((x - min_x, y - min_y) for x, y in piece.coords)
+        if cells in seen:
+            continue
+        seen.add(cells)
+        masks : Dict[int, int] = {}
+        for x, y in piece.coords:
+            masks[y] = masks.get(y, 0) | 1 << (x - min_x)
+        found.append(Orientation(piece, tuple(sorted(masks.items()))))
+    return tuple(found)
+
+# distinct orientations of each shape, indexed by Tetrominoes
+ORIENTATIONS : Tuple[Tuple[Orientation, ...], ...] = tuple(_orientations(shape)
+                                                           for shape in Tetrominoes)
+
+# number of rows a piece can extend above the highest occupied tile of the columns it lands on
+MAX_EXTENT = max(max_y - min_y + 1 for extents in Shape.extents for _, _, min_y, max_y in extents)
+
+def column_heights(rows: Sequence[int], width: int) -> List[int]:
+    """Height of each column of a board given by its row bitmasks"""
+    heights = [0] * width
+    for y, row in enumerate(rows):
+        while row:
+            low = row & -row
+            heights[low.bit_length() - 1] = y + 1
+            row ^= low
+    return heights
+
+def rows_key(rows: Sequence[int]) -> int:
+    """64-bit Zobrist hash of a board given by its row bitmasks, the XOR of the key of each
+    occupied row at its position. Empty rows are left out, hence rows above the stack do not
+    change it"""
+    key = 0
+    for y, row in enumerate(rows):
+        if row:
+            key ^= row_key(row, y)
+    return key
+
+def placements(board: TetrisBoard, piece: Shape) -> List[Placement]:
+    """Enumerate every distinct placement of a piece on the board: each distinct orientation of
+    the piece's shape at each column that it fits horizontally, dropped from above the stack to
+    its landing row, and that all its tiles are within the board. Positions reachable only by
+    sliding or rotating the piece under an overhang are not included.
+
+    Only the rows of the stack and the few above it that a piece can reach are looked at, hence
+    the rows of each placement leave out the empty rows above, and it costs by the height of the
+    stack, not of the board.
+
+    Returns:
+        The placements, ordered by orientation and then column
+    """
+    top = min(board.nTilesV, max(board.heights) + MAX_EXTENT)
+    return placements_on(board.bitmasks(top), board.heights, board.nTilesH, board.nTilesV, piece)
+
+def placements_on(rows: List[int], heights: List[int], width: int, height: int,
+                  piece: Shape, key: Optional[int] = None) -> List[Placement]:
+    """Same as placements() but on a board given by its row bitmasks and column heights, e.g.,
+    those of another placement to search a piece after it, with its key if known. The rows above
+    the stack can be left out of the bitmasks, as many of them as needed are added as empty rows.
+    The key of each placement is updated for only the rows that the piece is on, unless any row is
+    cleared"""
+    if key is None:
+        key = rows_key(rows)
+    top = min(height, max(heights) + MAX_EXTENT)
+    if len(rows) < top:
+        rows = rows + [0] * (top - len(rows))
+    fullrow = (1 << width) - 1
+    found = []
+    for orientation in ORIENTATIONS[piece.shape]:
+        p = orientation.piece
+        min_x, max_x, _, max_y = p.extent
+        bottom = p.bottom
+        coords = p.coords
+        for x in range(-min_x, width - max_x):
+            y = max(heights[x+px] - py for px, py in bottom)
+            if y + max_y >= height:
+                continue # sticks out of the top
+            new = rows[:]
+            shift = x + min_x
+            full = []
+            newkey = key
+            for py, mask in orientation.masks:
+                old = new[y+py]
+                row = old | mask << shift
+                new[y+py] = row
+                if row == fullrow:
+                    full.append(y+py)
+                newkey ^= row_key(row, y+py) ^ (row_key(old, y+py) if old else 0)
+            if full:
+                for j in reversed(full): # from top to bottom, as the row index below is unaffected
+                    del new[j]
+                new.extend([0] * len(full))
+                tops = column_heights(new, width)
+                newkey = rows_key(new)
+            else:
+                tops = heights[:]
+                for px, py in coords:
+                    if y + py >= tops[x+px]:
+                        tops[x+px] = y + py + 1
+            found.append(Placement(p, x, y, new, len(full), tops, newkey))
+    return found
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
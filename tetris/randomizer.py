@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+Sources of the sequence of pieces. Each game owns one with its own random number generator, such
+that a game is reproducible from its seed, without sharing the global state of the random module.
+"""
+from __future__ import annotations
+
+from typing import Deque, Dict, Iterable, List, Optional, Type
+from collections import deque
+import copy
+import random
+
+from .shape import Tetrominoes
+
+SHAPES = tuple(Tetrominoes)[1:] # the 7 tetrominoes, i.e., all but NoShape
+_BY_ID = tuple(Tetrominoes)     # look up enum by integer faster than calling Tetrominoes()
+
+class Randomizer:
+    """Base class of piece sources. Subclasses implement generate() to draw a number of pieces
+    in bulk, which next() takes one at a time from a buffer. The sequence produced is the same
+    regardless of how it is chunked.
+    """
+    chunk = 256 # number of pieces to draw each time the buffer is exhausted
+
+    def __init__(self, seed: Optional[int] = None):
+        """Create the piece source with its own random number generator. Seed of None will make
+        it initialized from system randomness"""
+        self.rng = random.Random(seed)
+        self._buffer = b""
+        self._index = 0
+
+    def __deepcopy__(self, memo) -> Randomizer:
+        """Copy the randomizer, e.g., to fork a game, which then draws the same pieces. The random
+        number generator is copied by its state, which is much faster than deepcopy() of it"""
+        new = copy.copy(self)
+        for name, value in vars(self).items():
+            if isinstance(value, random.Random):
+                value, state = type(value)(0), value.getstate()
+                value.setstate(state)
+            else:
+                value = copy.deepcopy(value, memo)
+            setattr(new, name, value)
+        return new
+
+    def generate(self, n: int) -> bytes:
+        """Draw the next n pieces as a compact array of the integer values of Tetrominoes. This
+        advances the sequence, i.e., those pieces will not be returned by next()"""
+        raise NotImplementedError
+
+    def next(self) -> Tetrominoes:
+        """Give the next piece in the sequence"""
+        if self._index >= len(self._buffer):
+            self._buffer = self.generate(self.chunk)
+            self._index = 0
+        piece = self._buffer[self._index]
+        self._index += 1
+        return _BY_ID[piece]
+
+    def prepend(self, pieces: bytes) -> None:
+        """Put pieces, e.g., drawn by generate() but not used, in front of the sequence such
+        that next() gives them first"""
+        self._buffer = bytes(pieces) + self._buffer[self._index:]
+        self._index = 0
+
+class UniformRandomizer(Randomizer):
+    """Each piece is drawn independently with equal probability, as Shape.randomize() does"""
+    def generate(self, n: int) -> bytes:
+        return bytes(self.rng.choices(SHAPES, k=n))
+
+class BagRandomizer(Randomizer):
+    """The 7-bag randomizer: all 7 pieces are put into a bag in random order and drawn one by one.
+    A new bag is filled when it is empty. Hence the same piece appears at most twice in a row"""
+    def __init__(self, seed: Optional[int] = None):
+        super().__init__(seed)
+        self._bag : List[int] = []
+
+    def generate(self, n: int) -> bytes:
+        pieces = bytearray(n)
+        for i in range(n):
+            if not self._bag:
+                self._bag = list(SHAPES)
+                self.rng.shuffle(self._bag)
+            pieces[i] = self._bag.pop()
+        return bytes(pieces)
+
+class HistoryRandomizer(Randomizer):
+    """The randomizer of Tetris The Grand Master: remember the last 4 pieces, and draw again, up to
+    a number of times, if the piece drawn is one of them. The first piece is never S, Z, or O"""
+    def __init__(self, seed: Optional[int] = None, history: int = 4, tries: int = 6):
+        super().__init__(seed)
+        self.tries = tries
+        self._history : Deque[int] = deque([Tetrominoes.ZShape, Tetrominoes.SShape] * history,
+                                           maxlen=history)
+        self._first = True
+
+    def generate(self, n: int) -> bytes:
+        pieces = bytearray(n)
+        for i in range(n):
+            if self._first:
+                piece = self.rng.choice([Tetrominoes.IShape, Tetrominoes.JShape,
+                                         Tetrominoes.LShape, Tetrominoes.TShape])
+                self._first = False
+            else:
+                for _ in range(self.tries):
+                    piece = self.rng.choice(SHAPES)
+                    if piece not in self._history:
+                        break
+            self._history.append(piece)
+            pieces[i] = piece
+        return bytes(pieces)
+
+class SequenceRandomizer(Randomizer):
+    """Replay a given sequence of pieces, e.g., one pre-drawn by generate() of another randomizer,
+    and start over from its beginning when it is exhausted"""
+    def __init__(self, pieces: Iterable[int], seed: Optional[int] = None):
+        super().__init__(seed)
+        self.pieces = bytes(pieces)
+        if not self.pieces:
+            raise ValueError("Empty sequence of pieces")
+        self._pos = 0
+
+    def generate(self, n: int) -> bytes:
+        length = len(self.pieces)
+        out = bytearray()
+        while len(out) < n:
+            take = min(n - len(out), length - self._pos)
+            out += self.pieces[self._pos:self._pos+take]
+            self._pos = (self._pos + take) % length
+        return bytes(out)
+
+RANDOMIZERS : Dict[str, Type[Randomizer]] = {
+    "uniform": UniformRandomizer,
+    "bag": BagRandomizer,
+    "history": HistoryRandomizer,
+}
+
+def make_randomizer(name: str, seed: Optional[int] = None) -> Randomizer:
+    """Create a randomizer by its name in RANDOMIZERS"""
+    try:
+        return RANDOMIZERS[name](seed)
+    except KeyError:
+        raise ValueError("Unknown randomizer %r, use one of %s"
+                         % (name, ", ".join(RANDOMIZERS))) from None
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
@@ -0,0 +1,396 @@
+# -*- coding: utf-8 -*-
+"""
+Record a game into a compact binary replay and play it back. The recorder hooks the methods of a
+TetrisGame that change its state, and writes one event per call: the pieces drawn from the
+randomizer and every input, each with the tick it happened as the difference from the last event.
+Playing back calls the same methods in the same order on a new game, which reproduces the game
+exactly without the randomizer, a policy, or a timer. Run as
+
+    python3 -m tetris.replay GAME.ttr --seek 1000
+
+The format is a header of the magic bytes and the board size, followed by the events until the
+end of the stream. Each event is one byte of the event code in the low 4 bits and the tick delta
+in the high 4 bits, or 15 in the high bits and the delta minus 15 as a varint in the bytes after.
+A "piece" event has one more byte of the shape, and a "pos" event, which is a try_pos() that is
+not one of the moves, has the shape and rotation in a byte and the position as zigzag varints.
+Hence most events, and all inputs from the keyboard, take one byte, and the stream can be written
+and read one event at a time.
+"""
+from __future__ import annotations
+
+from collections import deque
+from typing import BinaryIO, Deque, Iterator, List, NamedTuple, Optional, Tuple, Union
+import argparse
+import sys
+import time
+
+from .shape import Tetrominoes, Shape
+from .game import GameState, TetrisGame, apply_move
+from .randomizer import Randomizer
+
+MAGIC = b"TTR1"
+
+# Event codes, as index into this tuple: start(), one of the moves of the simulator,
+# make_new_piece(), a piece drawn by new_piece(), and try_pos() to any other position
+EVENTS = ("start", "left", "right", "cw", "ccw", "down", "drop", "new", "piece", "pos")
+START, LEFT, RIGHT, CW, CCW, DOWN, DROP, NEW, PIECE, POS = range(len(EVENTS))
+
+class Event(NamedTuple):
+    """An event decoded from a replay"""
+    tick: int               # tick the event happened
+    code: int               # index into EVENTS
+    data: Tuple[int, ...]   # (shape,) for piece, (shape, rotation, x, y) for pos, else empty
+
+def _varint(n: int) -> bytes:
+    """Encode a non-negative integer in 7 bits per byte, lowest first, high bit set if more"""
+    out = bytearray()
+    while n >= 0x80:
+        out.append(n & 0x7F | 0x80)
+        n >>= 7
+    out.append(n)
+    return bytes(out)
+
+def _zigzag(n: int) -> int:
+    """Map a signed integer to non-negative: 0, -1, 1, -2, ... to 0, 1, 2, 3, ..."""
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+def _unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+class ReplayRecorder:
+    """Write the events of a game to a binary stream. The tick of each event is self.tick, which
+    the driver of the game, e.g., the simulator, keeps up to date. Only the outermost call of the
+    hooked methods is recorded, e.g., not the try_pos() inside one_row_down(), except the pieces
+    drawn, such that replaying the recorded calls makes the same calls inside.
+    """
+    hooked = ("start", "new_piece", "make_new_piece", "try_pos", "one_row_down", "hard_drop")
+
+    def __init__(self, stream: BinaryIO):
+        self.stream = stream
+        self.tick = 0
+        self.game : Optional[TetrisGame] = None
+        self._last = 0   # tick of the last event written
+        self._depth = 0  # number of hooked calls in progress
+
+    def attach(self, game: TetrisGame) -> None:
+        """Write the header and start recording the game, by wrapping the hooked methods of the
+        game object. It must be attached before start()"""
+        self.game = game
+        self.stream.write(MAGIC + _varint(game.nTilesH) + _varint(game.nTilesV))
+        start, new_piece, make_new_piece = game.start, game.new_piece, game.make_new_piece
+        try_pos, one_row_down, hard_drop = game.try_pos, game.one_row_down, game.hard_drop
+
+        def hooked_start() -> bool:
+            started = self.call(start)
+            if started and not self._depth:
+                self.write(START)
+            return started
+
+        def hooked_new_piece() -> Shape:
+            piece = new_piece()
+            self.write(PIECE, bytes([piece.shape])) # always, as it is not drawn on replay
+            return piece
+
+        def hooked_make_new_piece() -> bool:
+            placed = self.call(make_new_piece)
+            if not self._depth:
+                self.write(NEW)
+            return placed
+
+        def hooked_try_pos(piece: Shape, x: int, y: int) -> bool:
+            if self._depth:
+                return try_pos(piece, x, y)
+            move = self.classify(piece, x, y)
+            moved = self.call(try_pos, piece, x, y)
+            if not moved:
+                pass # no change to the game, nothing to replay
+            elif move != POS:
+                self.write(move)
+            else:
+                self.write(POS, bytes([piece.shape << 2 | piece.rotation])
+                           + _varint(_zigzag(x)) + _varint(_zigzag(y)))
+            return moved
+
+        def hooked_one_row_down() -> bool:
+            moved = self.call(one_row_down)
+            if not self._depth:
+                self.write(DOWN)
+            return moved
+
+        def hooked_hard_drop() -> None:
+            self.call(hard_drop)
+            if not self._depth:
+                self.write(DROP)
+
+        game.start = hooked_start
+        game.new_piece = hooked_new_piece
+        game.make_new_piece = hooked_make_new_piece
+        game.try_pos = hooked_try_pos
+        game.one_row_down = hooked_one_row_down
+        game.hard_drop = hooked_hard_drop
+
+    def detach(self) -> None:
+        """Stop recording, the game's methods are restored"""
+        for name in self.hooked:
+            self.game.__dict__.pop(name, None)
+        self.game = None
+
+    def call(self, func, *args):
+        """Call a hooked method, with the calls inside marked nested"""
+        self._depth += 1
+        try:
+            return func(*args)
+        finally:
+            self._depth -= 1
+
+    def classify(self, piece: Shape, x: int, y: int) -> int:
+        """Tell which move a try_pos() is from the current position, or POS if none"""
+        game = self.game
+        this = game.this_piece
+        if piece == this and y == game.cur_y:
+            if x == game.cur_x - 1:
+                return LEFT
+            if x == game.cur_x + 1:
+                return RIGHT
+        elif x == game.cur_x and y == game.cur_y:
+            if piece == this.rotate_cw():
+                return CW
+            if piece == this.rotate_ccw():
+                return CCW
+        return POS
+
+    def write(self, code: int, payload: bytes = b"") -> None:
+        """Write one event at the current tick"""
+        delta = self.tick - self._last
+        if delta < 0:
+            raise ValueError("Tick %d is before the last event at %d" % (self.tick, self._last))
+        self._last = self.tick
+        if delta < 15:
+            self.stream.write(bytes([code | delta << 4]) + payload)
+        else:
+            self.stream.write(bytes([code | 0xF0]) + _varint(delta - 15) + payload)
+
+class ReplayReader:
+    """Decode the events of a replay from a binary stream, reading it in blocks, or from a buffer
+    such as a view into an archive, reading it in place"""
+    block = 1 << 16
+
+    def __init__(self, source: Union[BinaryIO, bytes, memoryview]):
+        if hasattr(source, "read"):
+            self.stream : Optional[BinaryIO] = source
+            self._buffer : Union[bytes, memoryview] = b""
+            self._offset = source.tell() if source.seekable() else 0 # stream position of buffer
+        else:
+            self.stream = None
+            self._buffer = memoryview(source)
+            self._offset = 0
+        self._pos = 0
+        if self.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a replay, bad magic bytes")
+        self.width = self.varint()
+        self.height = self.varint()
+        self.tick = 0 # tick of the last event read
+
+    def __iter__(self) -> Iterator[Event]:
+        event = self.event()
+        while event is not None:
+            yield event
+            event = self.event()
+
+    def seekable(self) -> bool:
+        return self.stream is None or self.stream.seekable()
+
+    def tell(self) -> int:
+        """Position in the stream of the next event"""
+        return self._offset + self._pos
+
+    def seek(self, offset: int, tick: int) -> None:
+        """Continue reading from an offset from tell(), where the last event was at tick"""
+        if self.stream is None:
+            self._pos = offset
+        else:
+            self.stream.seek(offset)
+            self._buffer, self._pos, self._offset = b"", 0, offset
+        self.tick = tick
+
+    def byte(self) -> int:
+        """Read one byte, or -1 at the end of the stream"""
+        if self._pos >= len(self._buffer):
+            if self.stream is None:
+                return -1
+            self._offset += len(self._buffer)
+            self._buffer, self._pos = self.stream.read(self.block), 0
+            if not self._buffer:
+                return -1
+        value = self._buffer[self._pos]
+        self._pos += 1
+        return value
+
+    def read(self, n: int) -> bytes:
+        return bytes(self.byte() for _ in range(n))
+
+    def varint(self) -> int:
+        value, shift = 0, 0
+        while True:
+            byte = self.byte()
+            if byte < 0:
+                raise EOFError("Truncated replay")
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value
+            shift += 7
+
+    def event(self) -> Optional[Event]:
+        """Read the next event, or None at the end of the stream"""
+        head = self.byte()
+        if head < 0:
+            return None
+        code, delta = head & 0x0F, head >> 4
+        if delta == 15:
+            delta += self.varint()
+        self.tick += delta
+        if code == PIECE:
+            return Event(self.tick, code, (self.byte(),))
+        if code == POS:
+            piece = self.byte()
+            x, y = _unzigzag(self.varint()), _unzigzag(self.varint())
+            return Event(self.tick, code, (piece >> 2, piece & 3, x, y))
+        if code >= len(EVENTS):
+            raise ValueError("Unknown event code %d" % code)
+        return Event(self.tick, code, ())
+
+class ReplayPieces(Randomizer):
+    """Randomizer of a replayed game: the pieces as they are read from the replay"""
+    def __init__(self):
+        super().__init__(0)
+        self.pieces : Deque[int] = deque()
+
+    def next(self) -> Tetrominoes:
+        return Tetrominoes(self.pieces.popleft())
+
+class ReplayPlayer:
+    """Re-simulate a recorded game from a replay stream or buffer, one event at a time or to any
+    tick. A copy of the game is kept every snapshot_every ticks, such that seeking back on a
+    seekable stream resumes from the last snapshot before the tick instead of replaying from the
+    start.
+    """
+    def __init__(self, source: Union[BinaryIO, bytes, memoryview], snapshot_every: int = 600):
+        self.reader = ReplayReader(source)
+        self.snapshot_every = snapshot_every
+        self.pieces = ReplayPieces()
+        self.game = TetrisGame(self.reader.width, self.reader.height, randomizer=self.pieces)
+        self.tick = 0 # tick of the last event applied
+        self.events = 0 # number of events applied
+        self._next : Optional[Event] = None # event read but not applied yet
+        self._offset = self.reader.tell() # stream position of self._next, or the next event
+        # (tick, stream offset, tick of the event before, number of events, game) of each snapshot
+        self.snapshots : List[Tuple[int, int, int, int, GameState]] = []
+        self._snapshot_at = 0
+        if self.reader.seekable():
+            self.snapshot(0)
+
+    def peek(self) -> Optional[Event]:
+        """The next event to apply, or None at the end of the replay"""
+        if self._next is None:
+            self._offset = self.reader.tell()
+            self._next = self.reader.event()
+        return self._next
+
+    def step(self) -> Optional[Event]:
+        """Apply the next event to the game
+
+        Returns:
+            The event applied, or None at the end of the replay
+        """
+        event = self.peek()
+        if event is None:
+            return None
+        if event.tick >= self._snapshot_at and self.reader.seekable() \
+           and event.tick > self.snapshots[-1][0]: # not yet taken before seeking back
+            self.snapshot(event.tick)
+        self._next = None
+        self.apply(event)
+        self.tick = event.tick
+        self.events += 1
+        return event
+
+    def snapshot(self, tick: int) -> None:
+        """Keep a copy of the game before the next event, which is at the tick or later"""
+        self.snapshots.append((tick, self._offset, self.tick, self.events, self.game.snapshot()))
+        self._snapshot_at = tick + self.snapshot_every
+
+    def apply(self, event: Event) -> None:
+        """Make the call on the game that the event recorded"""
+        game, code = self.game, event.code
+        if code == PIECE:
+            self.pieces.pieces.append(event.data[0])
+        elif code == START:
+            game.start()
+        elif code == NEW:
+            game.make_new_piece()
+        elif code == POS:
+            shape, rotation, x, y = event.data
+            game.try_pos(Shape.table[shape][rotation], x, y)
+        else:
+            apply_move(game, EVENTS[code])
+
+    def run(self) -> TetrisGame:
+        """Apply all remaining events as fast as possible
+
+        Returns:
+            The game at the end of the replay
+        """
+        while self.step() is not None:
+            pass
+        return self.game
+
+    def seek(self, tick: int) -> TetrisGame:
+        """Bring the game to its state after all events up to the tick, resuming from the last
+        snapshot before it if that is later than where the game is, or if seeking back
+
+        Returns:
+            The game at the tick
+        """
+        best = None
+        for snapshot in self.snapshots:
+            if snapshot[0] > tick:
+                break
+            best = snapshot
+        if best is not None and (best[3] > self.events or tick < self.tick):
+            snap_tick, offset, before, events, state = best
+            self.reader.seek(offset, before)
+            self.game.restore(state)
+            self.pieces = self.game.randomizer
+            self.tick, self.events, self._next = before, events, None
+            self._snapshot_at = snap_tick + self.snapshot_every
+        elif tick < self.tick:
+            raise ValueError("Cannot seek back to tick %d, stream is not seekable" % tick)
+        while True:
+            event = self.peek()
+            if event is None or event.tick > tick:
+                return self.game
+            self.step()
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Play back a Tetris replay headless")
+    parser.add_argument("replay", help="replay file")
+    parser.add_argument("--seek", type=int, default=None,
+                        help="stop at this tick instead of the end of the replay")
+    args = parser.parse_args(argv)
+
+    with open(args.replay, "rb") as stream:
+        player = ReplayPlayer(stream)
+        start = time.perf_counter()
+        game = player.run() if args.seek is None else player.seek(args.seek)
+        elapsed = time.perf_counter() - start
+    print("tick: %d\nevents: %d\npieces: %d\nrows: %d\nstarted: %s"
+          % (player.tick, player.events, game.pieces, game.rows_completed, game.started))
+    print("%d events in %.3f s, %.0f events/s" % (player.events, elapsed,
+                                                   player.events / max(elapsed, 1e-9)),
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Tetromino shapes, independent of the GUI library
+"""
+from __future__ import annotations
+
+from enum import IntEnum, unique
+from typing import Tuple
+import random
+
+@unique
+class Tetrominoes(IntEnum):
+    """Name of one-sided tetrominoes, https://en.wikipedia.org/wiki/Tetromino"""
+    NoShape = 0
+    IShape = 1
+    JShape = 2
+    LShape = 3
+    OShape = 4
+    SShape = 5
+    TShape = 6
+    ZShape = 7
+
+class Shape:
+    """7 tetrominoes shapes + dummy. We make x axis the bottom edge each shape, hence min y for
+    shape coordinates should be 0. All 4 orientations of each shape are precomputed into a table
+    once, so rotating a shape returns a reference to another object in the table.
+
+    A shape object is immutable and holds only the shape, the rotation index, and the cached
+    coordinates, extent, and bottom profile from the table. Hence reading its geometry never
+    allocates.
+    """
+    __slots__ = ("shape", "rotation", "coords", "x", "y", "extent", "bottom")
+    shapeCoords = (
+        (( 0, 0), (0, 0), (0, 0), (0, 0)),  # 0 = NoShape
+        (( 0, 3), (0, 2), (0, 1), (0, 0)),  # 1 = I
+        ((-1, 0), (0, 0), (0, 1), (0, 2)),  # 2 = J
+        (( 1, 0), (0, 0), (0, 1), (0, 2)),  # 3 = L
+        (( 0, 1), (1, 1), (0, 0), (1, 0)),  # 4 = O
+        ((-1, 0), (0, 0), (0, 1), (1, 1)),  # 5 = S
+        ((-1, 0), (0, 0), (1, 0), (0, 1)),  # 6 = T
+        ((-1, 1), (0, 1), (0, 0), (1, 0)),  # 7 = Z
+    )
+    # Filled by _build_tables() below: rotations[shape][r] is the coordinates after rotating r
+    # times 90 deg cw about origin, extents[shape][r] is the bounding box (min_x, max_x, min_y,
+    # max_y) of it, and table[shape][r] is the Shape object of it
+    rotations : Tuple[Tuple[Tuple[Tuple[int, int], ...], ...], ...] = ()
+    extents : Tuple[Tuple[Tuple[int, int, int, int], ...], ...] = ()
+    table : Tuple[Tuple[Shape, ...], ...] = ()
+
+    shape : Tetrominoes                  # shape of this piece
+    rotation : int                       # number of 90 deg cw rotations, 0 to 3
+    coords : Tuple[Tuple[int, int], ...] # coordinates of the four tiles
+    x : Tuple[int, ...]                  # all x-coordinate of the tiles
+    y : Tuple[int, ...]                  # all y-coordinate of the tiles
+    extent : Tuple[int, int, int, int]   # bounding box as (min_x, max_x, min_y, max_y)
+    bottom : Tuple[Tuple[int, int], ...] # (x, min y) of the lowest tile in each column, by x
+
+    def __init__(self, shape: Tetrominoes = Tetrominoes.NoShape, rotation: int = 0):
+        """Construct a new shape at the given orientation. All attributes are references to the
+        precomputed table. Use Shape.table[shape][rotation] instead to avoid creating a new object.
+        """
+        rotation %= 4
+        coords = Shape.rotations[shape][rotation]
+        setattr_ = object.__setattr__ # bypass immutability in constructor only
+        setattr_(self, "shape", Tetrominoes(shape))
+        setattr_(self, "rotation", rotation)
+        setattr_(self, "coords", coords)
+        setattr_(self, "x", tuple(x for x, _ in coords))
+        setattr_(self, "y", tuple(y for _, y in coords))
+        setattr_(self, "extent", Shape.extents[shape][rotation])
+        setattr_(self, "bottom", tuple((x, min(py for px, py in coords if px == x))
+                                       for x in sorted(set(x for x, _ in coords))))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Shape is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("Shape is immutable")
+
+    def __copy__(self) -> Shape:
+        return self # immutable, copies of a game can share it
+
+    def __deepcopy__(self, memo) -> Shape:
+        return self
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Shape):
+            return NotImplemented
+        return self.shape == other.shape and self.rotation == other.rotation
+
+    def __hash__(self) -> int:
+        return hash((self.shape, self.rotation))
+
+    def __repr__(self) -> str:
+        return "Shape(%s, %d)" % (self.shape.name, self.rotation)
+
+    @staticmethod
+    def randomize() -> Shape:
+        """Give a random piece"""
+        shape = Tetrominoes(random.randint(1, len(Shape.shapeCoords)-1))
+        return Shape.table[shape][0]
+
+    def min_y(self) -> int:
+        "Tell the min y-coordinate of this shape"
+        return self.extent[2]
+
+    def rotate_cw(self) -> Shape:
+        "Produce a piece of this shape rotate about origin for 90 deg cw"
+        return Shape.table[self.shape][(self.rotation + 1) % 4]
+
+    def rotate_ccw(self) -> Shape:
+        "Produce a piece of this shape rotate about origin for 90 deg ccw"
+        return Shape.table[self.shape][(self.rotation - 1) % 4]
+
+    @classmethod
+    def _build_tables(cls) -> None:
+        """Precompute the coordinates, bounding boxes, and Shape objects of all orientations of
+        all shapes. Called once only at module load. "O" is not rotated, all its orientations
+        are the same
+        """
+        cw = lambda x, y: (y, -x)
+        rotations = []
+        for shape, coords in enumerate(cls.shapeCoords):
+            orientations = [tuple(coords)]
+            for _ in range(3):
+                if shape == Tetrominoes.OShape:
+                    orientations.append(orientations[-1]) # no rotate for "O"
+                else:
+                    orientations.append(tuple(cw(x, y) for x, y in orientations[-1]))
+            rotations.append(tuple(orientations))
+        cls.rotations = tuple(rotations)
+        cls.extents = tuple(
+            tuple((min(x for x, _ in c), max(x for x, _ in c), min(y for _, y in c), max(y for _, y in c))
+                  for c in orientations)
+            for orientations in cls.rotations)
+        cls.table = tuple(tuple(cls(Tetrominoes(shape), r) for r in range(4))
+                          for shape in range(len(cls.shapeCoords)))
+
+Shape._build_tables()
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4:
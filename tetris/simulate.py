@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Headless simulator: run many games of Tetris as fast as possible, without any GUI and timer, with
+the moves decided by a pluggable input policy. Run as
+
+    python3 -m tetris.simulate --games 1000 --seed 0 --policy random --workers 0
+
+which prints the statistics of each game in CSV to stdout and the summary to stderr. Games are
+sharded across worker processes, which the results do not depend on.
+"""
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Sequence, Union
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import functools
+import importlib
+import os
+import random
+import statistics
+import sys
+import time
+
+from .game import GAMES, Policy, TetrisGame, apply_move
+from .randomizer import RANDOMIZERS, make_randomizer
+
+if TYPE_CHECKING:
+    from .replay import ReplayRecorder
+
+class GameStats(NamedTuple):
+    """Statistics of one simulated game"""
+    seed: int
+    pieces: int      # number of pieces entered the board
+    rows: int        # number of rows completed
+    ticks: int       # number of timer ticks the game lasted
+    duration: float  # wall clock time in seconds to simulate the game
+
+def play(game: TetrisGame, policy: Policy, max_pieces: int = 0,
+         recorder: Optional[ReplayRecorder] = None) -> int:
+    """Play one game until it is over, or until max_pieces pieces are entered if it is positive.
+    One input of the policy is applied on each tick, before the piece falls for one row. The
+    recorder attached to the game, if any, is kept at the current tick.
+
+    Returns:
+        The number of ticks the game lasted
+    """
+    game.start()
+    ticks = 0
+    moves = iter(policy(game))
+    while game.started:
+        ticks += 1
+        if recorder is not None:
+            recorder.tick = ticks
+        if game.neednewpiece:
+            # same as the GUI timer: the tick after a piece dropped produces a new piece
+            if max_pieces and game.pieces >= max_pieces:
+                break
+            if not game.make_new_piece():
+                break
+            moves = iter(policy(game))
+            continue
+        move = next(moves, None)
+        if move is not None:
+            apply_move(game, move)
+        if not game.neednewpiece:
+            game.one_row_down()
+    return ticks
+
+def run_game(seed: int, policy: Policy, width: int = 10, height: int = 18,
+             max_pieces: int = 0, randomizer: str = "uniform",
+             record: Optional[str] = None, board: str = "bit") -> GameStats:
+    """Simulate one game with the given random seed, which seeds the game's randomizer, and also
+    game.rng, a random.Random of its own for the policies that use it, such that the global state
+    of the random module is not touched. The game is on the board backend by its name in GAMES.
+    If record is a directory, the replay of the game is written there as <seed>.ttr"""
+    game = GAMES[board](width, height, randomizer=make_randomizer(randomizer, seed))
+    game.rng = random.Random(seed)
+    start = time.perf_counter()
+    if record is None:
+        ticks = play(game, policy, max_pieces)
+    else:
+        from .replay import ReplayRecorder # imports this module
+        with open(os.path.join(record, "%d.ttr" % seed), "wb") as stream:
+            recorder = ReplayRecorder(stream)
+            recorder.attach(game)
+            ticks = play(game, policy, max_pieces, recorder)
+    duration = time.perf_counter() - start
+    return GameStats(seed, game.pieces, game.rows_completed, ticks, duration)
+
+def _run_game_by_name(seed: int, policy: str, width: int, height: int, max_pieces: int,
+                      randomizer: str, record: Optional[str], board: str) -> GameStats:
+    """Same as run_game() but with the policy by name, such that the call can be sent to a worker
+    process"""
+    return run_game(seed, load_policy(policy), width, height, max_pieces, randomizer, record,
+                    board)
+
+def run_games(seeds: Sequence[int], policy: str, width: int = 10, height: int = 18,
+              max_pieces: int = 0, workers: int = 1, randomizer: str = "uniform",
+              record: Optional[str] = None, board: str = "bit") -> List[GameStats]:
+    """Simulate one game for each seed, sharded across a pool of worker processes if workers is
+    not 1, or as many processes as the CPU cores if workers is 0. The policy is given by name as
+    in load_policy() as it has to be found in the worker process.
+
+    Returns:
+        The statistics of each game, in the same order as the seeds. Except the duration, they
+        depend only on the seeds but not on the number of workers
+    """
+    func = functools.partial(_run_game_by_name, policy=policy, width=width, height=height,
+                             max_pieces=max_pieces, randomizer=randomizer, record=record,
+                             board=board)
+    if workers == 1:
+        return [func(seed) for seed in seeds]
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(seeds) // (workers * 4)) # few chunks per worker to balance the load
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(func, seeds, chunksize=chunksize))
+
+def summarize(results: Sequence[GameStats]) -> Dict[str, float]:
+    """Merge the statistics of many games into the summary: number of games, total time spent on
+    simulation, and the mean, standard deviation, min and max of pieces, rows and ticks"""
+    summary : Dict[str, float] = {
+        "games": len(results),
+        "duration": sum(stats.duration for stats in results),
+    }
+    for field in ["pieces", "rows", "ticks"]:
+        values = [getattr(stats, field) for stats in results]
+        if not values:
+            continue
+        summary[field+"_mean"] = statistics.fmean(values)
+        summary[field+"_stdev"] = statistics.pstdev(values)
+        summary[field+"_min"] = min(values)
+        summary[field+"_max"] = max(values)
+    return summary
+
+#
+# Built-in policies
+#
+
+def drop_policy(game: TetrisGame) -> Iterable[str]:
+    """Drop every piece right away at where it appears"""
+    return ("drop",)
+
+def random_policy(game: TetrisGame) -> Iterable[str]:
+    """Rotate and shift the piece randomly, then drop it. The random numbers are drawn from
+    game.rng as set by run_game(), or from the random module if the game has none"""
+    rng = getattr(game, "rng", random)
+    moves = ["cw"] * rng.randint(0, 3)
+    shift = rng.randint(-game.nTilesH // 2, game.nTilesH // 2)
+    moves += ["left" if shift < 0 else "right"] * abs(shift)
+    moves.append("drop")
+    return moves
+
+def idle_policy(game: TetrisGame) -> Iterable[str]:
+    """No input at all, let each piece fall by gravity"""
+    return ()
+
+POLICIES : Dict[str, Union[Policy, str]] = {
+    "drop": drop_policy,
+    "random": random_policy,
+    "idle": idle_policy,
+    # imported on first use, as NumPy takes long to import
+    "ai": "tetris.ai:ai_policy",
+    "lookahead": "tetris.ai:lookahead_policy",
+}
+
+def load_policy(name: str) -> Policy:
+    """Find a policy by its name in POLICIES, or as "module:function" to import it"""
+    if name in POLICIES:
+        policy = POLICIES[name]
+        if isinstance(policy, str):
+            policy = POLICIES[name] = load_policy(policy)
+        return policy
+    if ":" not in name:
+        raise ValueError("Unknown policy %r, use one of %s or module:function"
+                         % (name, ", ".join(POLICIES)))
+    modname, funcname = name.split(":", 1)
+    return getattr(importlib.import_module(modname), funcname)
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description="Simulate Tetris games headless")
+    parser.add_argument("-n", "--games", type=int, default=1, help="number of games to play")
+    parser.add_argument("-s", "--seed", type=int, default=0,
+                        help="random seed of the first game, each subsequent game use the next integer")
+    parser.add_argument("-W", "--width", type=int, default=10, help="board width in tiles")
+    parser.add_argument("-H", "--height", type=int, default=18, help="board height in tiles")
+    parser.add_argument("-p", "--policy", default="random",
+                        help="input policy: %s, or module:function" % ", ".join(POLICIES))
+    parser.add_argument("-m", "--max-pieces", type=int, default=0,
+                        help="stop a game after this many pieces, 0 for no limit")
+    parser.add_argument("-r", "--randomizer", default="uniform", choices=list(RANDOMIZERS),
+                        help="how the sequence of pieces is generated")
+    parser.add_argument("-b", "--board", default="bit", choices=list(GAMES),
+                        help="board backend, sparse for very large boards that are mostly empty")
+    parser.add_argument("-j", "--workers", type=int, default=1,
+                        help="number of worker processes, 0 for one per CPU core")
+    parser.add_argument("--record", metavar="DIR", default=None,
+                        help="write the replay of each game to DIR/<seed>.ttr")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="print only the summary but not the statistics of each game")
+    args = parser.parse_args(argv)
+
+    load_policy(args.policy) # fail early if the policy is not found
+    if args.record is not None:
+        os.makedirs(args.record, exist_ok=True)
+    seeds = range(args.seed, args.seed + args.games)
+    start = time.perf_counter()
+    results = run_games(seeds, args.policy, args.width, args.height, args.max_pieces, args.workers,
+                        args.randomizer, args.record, args.board)
+    elapsed = time.perf_counter() - start
+    if not args.quiet:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(GameStats._fields)
+        writer.writerows(results)
+    for key, value in summarize(results).items():
+        print("%s: %s" % (key, round(value, 3)), file=sys.stderr)
+    print("%d games in %.3f s, %.1f games/s" % (args.games, elapsed, args.games / elapsed),
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
+
+# vim:set fdm=indent tw=100 et ts=4 sw=4: